@@ -2,38 +2,37 @@ import os
 import json
 import re
 import asyncio
-import aiohttp
+import argparse
+import datetime
+from auctionSnapshot import SNAPSHOT_SUFFIX, download_auctions, download_commodities, find_auction_file
+from blizzardClient import API_BASE_URL, create_session, fetch_json, get_oauth_token, request
+from runReport import report
 
 # Base endpoint configuration
-BASE_URL = "https://eu.api.blizzard.com"
+BASE_URL = API_BASE_URL
 NAMESPACE = "dynamic-eu"
-OAUTH_TOKEN_URL = "https://eu.battle.net/oauth/token"
 SAVE_FOLDER = "data/auctions/"
-REQUESTS_PER_SECOND = 90
+# "json" keeps the API layout, "columnar" writes compact .snap snapshots (see auctionSnapshot.py).
+SNAPSHOT_FORMAT = "json"
 REALMS_PATH = "data/connected-realms.json"
-
-async def get_oauth_token(session, client_id, client_secret):
-    """
-    Request an OAuth token using the Blizzard client credentials.
-    """
-    data = {"grant_type": "client_credentials"}
-    async with session.post(OAUTH_TOKEN_URL, data=data, auth=aiohttp.BasicAuth(client_id, client_secret)) as resp:
-        resp.raise_for_status()
-        token_data = await resp.json()
-        token = token_data.get("access_token")
-        if not token:
-            raise Exception("Could not retrieve access token.")
-        return token
+COMMODITIES_PATH = "data/commodities.json"
+# Key of the region commodities snapshot in LAST_MODIFIED_PATH.
+COMMODITIES_KEY = "commodities"
+# Saved snapshots waiting for evaluation in --pipeline mode before downloads are held back.
+PIPELINE_QUEUE_SIZE = 4
+LAST_MODIFIED_PATH = "data/last-modified.json"
+REALM_MAP_PATH = "data/realm-map.json"
+RELEVANT_REALMS_FILE = "config/relevantRealms.json"
+# Connected realm details rarely change, only refresh them once they are older than this.
+REALMS_CACHE_TTL = datetime.timedelta(days=7)
 
 async def get_connected_realms(session, headers):
     """
     Fetches the connected realm index from the Blizzard API.
     """
     url = f"{BASE_URL}/data/wow/connected-realm/?namespace={NAMESPACE}"
-    async with session.get(url, headers=headers) as resp:
-        resp.raise_for_status()
-        data = await resp.json()
-        return data.get("connected_realms", [])
+    data = await fetch_json(session, url, headers)
+    return data.get("connected_realms", [])
 
 
 async def get_connected_realm_details(session, realm_id, headers):
@@ -41,12 +40,9 @@ async def get_connected_realm_details(session, realm_id, headers):
     Fetches detailed connected realm data for a given realm id.
     This endpoint returns the main id and a list of realms with their names.
     """
-    await asyncio.sleep(DELAY)  # Keep rate limiting consistent.
     url = f"{BASE_URL}/data/wow/connected-realm/{realm_id}?namespace={NAMESPACE}"
     print(f"Fetching connected realm details for {realm_id} from {url}")
-    async with session.get(url, headers=headers) as resp:
-        resp.raise_for_status()
-        return await resp.json()
+    return await fetch_json(session, url, headers)
 
 
 def extract_realm_id(href):
@@ -60,27 +56,305 @@ def extract_realm_id(href):
         return match.group(1)
     return None
 
-DELAY = 1.0/REQUESTS_PER_SECOND
-async def get_auctions_for_realm(session, realm_id, headers):
+def load_relevant_realms():
+    """
+    Load the relevant realms from RELEVANT_REALMS_FILE.
+    Returns a dict mapping realm id to a friendly realm name.
+    """
+    try:
+        with open(RELEVANT_REALMS_FILE, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error loading relevant realms: {e}")
+        return {}
+
+
+def load_realm_cache():
     """
-    Fetches the auction data for a given realm.
-    Adds a small delay to keep the request rate under 100 requests per second.
+    Load the cached realm metadata written by the last connected realm details refresh.
+    Returns a dict with "updated_at" (ISO timestamp) and "realms" mapping realm id to connected realm id.
+    """
+    try:
+        with open(REALM_MAP_PATH, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"Error loading realm map: {e}")
+        return {}
+
+
+def load_realm_map():
+    """
+    Load the cached mapping of realm id to connected realm id.
+    """
+    return load_realm_cache().get("realms", {})
+
+
+def load_connected_realms_data():
+    try:
+        with open(REALMS_PATH, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"Error loading connected realms data: {e}")
+        return {}
+
+
+def is_realm_cache_fresh(realm_cache):
+    """
+    Whether the cached connected realm details are younger than REALMS_CACHE_TTL.
+    The age is stored in the file itself since checkouts reset file modification times.
+    """
+    try:
+        updated_at = datetime.datetime.fromisoformat(realm_cache["updated_at"])
+    except (KeyError, TypeError, ValueError):
+        return False
+    return datetime.datetime.now(datetime.timezone.utc) - updated_at < REALMS_CACHE_TTL
+
+
+def resolve_connected_realms(relevant_realms, realm_map):
+    """
+    Translate the configured realm ids into the connected realm ids whose auctions contain them.
+    Ids missing from the realm map are assumed to already be connected realm ids.
+    """
+    return sorted({realm_map.get(realm_id, realm_id) for realm_id in relevant_realms}, key=int)
+
+
+def select_auction_realms(realm_ids, relevant_realms, realm_map):
+    """
+    Pick the connected realms of realm_ids whose auctions contain one of the relevant realms.
+    Without a realm map the member realm ids cannot be resolved, so every connected realm is kept.
+    """
+    if not realm_map:
+        print(f"Warning: no realm map could be loaded or built, fetching all {len(realm_ids)} connected realms.")
+        return realm_ids
+    unmapped = sorted((realm_id for realm_id in relevant_realms
+                       if realm_id not in realm_map and realm_id not in realm_ids), key=int)
+    if unmapped:
+        print(f"Warning: realms {', '.join(unmapped)} from {RELEVANT_REALMS_FILE} are not in {REALM_MAP_PATH}, skipping them.")
+    wanted = set(resolve_connected_realms(relevant_realms, realm_map))
+    return [realm_id for realm_id in realm_ids if realm_id in wanted]
+
+
+async def update_realm_details(session, headers, realm_ids, force_refresh=False):
+    """
+    Refresh REALMS_PATH and REALM_MAP_PATH from the connected realm details of realm_ids.
+    Connected realm details are cached; they are only fetched when the cache expired, is missing
+    or the index lists connected realms we have not seen yet.
+    Returns the realm map, the cached one if no details could be fetched and empty if there is none.
+    """
+    realm_cache = load_realm_cache()
+    connected_realms_data = load_connected_realms_data()
+    cached_map = realm_map = realm_cache.get("realms", {})
+    refresh = force_refresh or not is_realm_cache_fresh(realm_cache)
+    if refresh:
+        connected_realms_data = {}
+        realm_map = {}
+        detail_realm_ids = realm_ids
+    else:
+        detail_realm_ids = [realm_id for realm_id in realm_ids if realm_id not in connected_realms_data]
+    if not detail_realm_ids:
+        print(f"Connected realm details in {REALMS_PATH} are up to date.")
+        return realm_map
+
+    # Create tasks for connected realm details
+    connected_realm_tasks = [
+        asyncio.create_task(get_connected_realm_details(session, realm_id, headers))
+        for realm_id in detail_realm_ids
+    ]
+    # Gather connected realm details concurrently.
+    with report.stage("fetch_realm_details"):
+        connected_realm_results = await asyncio.gather(*connected_realm_tasks, return_exceptions=True)
+    # Build a dictionary mapping each connected realm id to the list of realm names.
+    # Also map every member realm id to its connected realm id.
+    failed = False
+    for realm_id, result in zip(detail_realm_ids, connected_realm_results):
+        if isinstance(result, Exception):
+            print(f"Error fetching connected realm {realm_id}: {result}")
+            failed = True
+        else:
+            # Convert the main realm id to string to use as a JSON key.
+            main_realm_id = str(result.get("id"))
+            realm_names = [realm["name"] for realm in result.get("realms", [])]
+            connected_realms_data[main_realm_id] = realm_names
+            for realm in result.get("realms", []):
+                realm_map[str(realm["id"])] = main_realm_id
+    if not realm_map:
+        # Nothing to save; keep the previous files so the next run retries the refresh.
+        return cached_map
+
+    # Save the connected realms data to data/connected-realms.json
+    os.makedirs(os.path.dirname(REALMS_PATH), exist_ok=True)
+    with open(REALMS_PATH, "w") as f:
+        json.dump(connected_realms_data, f, indent=2)
+    print(f"Saved connected realms data to {REALMS_PATH}")
+
+    # Keep the previous refresh time if this one was incomplete, so it is retried next run.
+    updated_at = realm_cache.get("updated_at") if failed or not refresh else None
+    realm_cache = {
+        "updated_at": updated_at or datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "realms": dict(sorted(realm_map.items(), key=lambda item: int(item[0]))),
+    }
+    with open(REALM_MAP_PATH, "w") as f:
+        json.dump(realm_cache, f, indent=2)
+    print(f"Saved realm map to {REALM_MAP_PATH}")
+    return realm_map
+
+
+def load_last_modified():
+    """
+    Load the Last-Modified header values of the previously saved auction snapshots.
+    Returns a dict mapping realm id to the header value.
+    """
+    try:
+        with open(LAST_MODIFIED_PATH, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"Error loading last modified values: {e}")
+        return {}
+
+
+def save_last_modified(last_modified):
+    os.makedirs(os.path.dirname(LAST_MODIFIED_PATH), exist_ok=True)
+    with open(LAST_MODIFIED_PATH, "w") as f:
+        json.dump(last_modified, f, indent=2, sort_keys=True)
+
+
+async def get_auctions_for_realm(session, realm_id, headers, last_modified=None, snapshot_format=SNAPSHOT_FORMAT, delta=None):
+    """
+    Fetches the auction data for a given realm and streams it to SAVE_FOLDER.
+    If last_modified is given the request is made conditional; when the snapshot
+    did not change since then the server answers 304 and nothing is written.
+    delta is passed on to auctionSnapshot.save_snapshot ("emit", "only" or None).
+    Returns a tuple (auction_count, last_modified), with auction_count None on a 304.
     """
-    # Delay 0.01 seconds before each request to stay within the rate limit.
-    await asyncio.sleep(DELAY)
     url = f"{BASE_URL}/data/wow/connected-realm/{realm_id}/auctions?namespace={NAMESPACE}"
+    request_headers = dict(headers)
+    if last_modified:
+        request_headers["If-Modified-Since"] = last_modified
     print(f"Fetching auctions for realm {realm_id} from {url}")
-    async with session.get(url, headers=headers) as resp:
+    async with request(session, url, request_headers) as resp:
+        if resp.status == 304:
+            print(f"Auctions for realm {realm_id} not modified since {last_modified}")
+            report.count("snapshots_not_modified")
+            return None, last_modified
+        resp.raise_for_status()
+        suffix = SNAPSHOT_SUFFIX if snapshot_format == "columnar" else ".json"
+        filename = f"{SAVE_FOLDER}{realm_id}{suffix}"
+        count = await download_auctions(resp, filename, delta)
+        print(f"Saved {count} auctions for realm {realm_id} to {filename}")
+        report.count("snapshots_saved")
+        report.count("auctions_saved", count)
+        return count, resp.headers.get("Last-Modified")
+
+async def get_commodities(session, headers, last_modified=None):
+    """
+    Fetches the region-wide commodities auctions and stores per-item price aggregates in COMMODITIES_PATH.
+    The payload is streamed to disk and aggregated in one pass, it is never held in memory.
+    Returns a tuple (item_count, last_modified), with item_count None on a 304.
+    """
+    url = f"{BASE_URL}/data/wow/auctions/commodities?namespace={NAMESPACE}"
+    request_headers = dict(headers)
+    if last_modified:
+        request_headers["If-Modified-Since"] = last_modified
+    print(f"Fetching commodities from {url}")
+    async with request(session, url, request_headers) as resp:
+        if resp.status == 304:
+            print(f"Commodities not modified since {last_modified}")
+            report.count("snapshots_not_modified")
+            return None, last_modified
         resp.raise_for_status()
-        return await resp.json()
+        count = await download_commodities(resp, COMMODITIES_PATH)
+        print(f"Saved commodity prices for {count} items to {COMMODITIES_PATH}")
+        report.count("snapshots_saved")
+        return count, resp.headers.get("Last-Modified")
+
+async def queue_when_fetched(fetch, queue, key):
+    """
+    Await a snapshot fetch and hand its key to the evaluation queue. On a 304 the snapshot saved
+    by an earlier run is still current and is queued as well, so the pipeline evaluates the same
+    snapshots as a separate sniper.py run would.
+    Blocks while the queue is full, so downloads cannot run arbitrarily far ahead of evaluation.
+    """
+    result = await fetch
+    await queue.put(key)
+    return result
+
+
+async def evaluate_snapshots(queue):
+    """
+    Consumer of --pipeline mode: records the prices and finds the candidates of every realm as soon
+    as its snapshot is queued, until None is received. The cheapest candidates across all realms
+    are announced at the end, like sniper.py does. Evaluation runs in a worker thread so
+    downloads continue meanwhile.
+    """
+    try:
+        import sniper  # Only needed in pipelined mode.
+        conn = sniper.connect_db(check_same_thread=False)
+        sniper.init_db(conn)
+        sniper.init_announced_db(conn)
+        reference = await asyncio.to_thread(sniper.load_reference_data)
+    except Exception as e:
+        # Keep draining the queue so the downloads are not blocked.
+        print(f"Could not start the evaluation stage: {e}")
+        conn = None
+    candidates = []
+    while True:
+        key = await queue.get()
+        if key is None:
+            break
+        if conn is None:
+            continue
+        try:
+            if key == COMMODITIES_KEY:
+                await asyncio.to_thread(sniper.process_commodities, conn)
+            else:
+                candidates += await asyncio.to_thread(
+                    sniper.evaluate_files, conn, [find_auction_file(SAVE_FOLDER, key)], *reference, announce=False)
+        except Exception as e:
+            print(f"Error evaluating {key}: {e}")
+    if conn is not None:
+        try:
+            await asyncio.to_thread(sniper.announce_cheap_items, conn, candidates, reference[0])
+        except Exception as e:
+            print(f"Error announcing cheap items: {e}")
+        with report.stage("retention"):
+            await asyncio.to_thread(sniper.apply_retention, conn)
+        conn.close()
+        sniper.report_cache_stats()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fetch connected realm auction snapshots.")
+    parser.add_argument("--all-realms", action="store_true",
+                        help=f"Fetch every connected realm instead of only those in {RELEVANT_REALMS_FILE}.")
+    parser.add_argument("--commodities", action="store_true",
+                        help=f"Also fetch the region commodities auctions and aggregate them into {COMMODITIES_PATH}.")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Evaluate each realm with sniper.py as soon as its snapshot is fetched, "
+                             "then announce the cheapest deals across all realms.")
+    parser.add_argument("--refresh-realms", action="store_true",
+                        help=f"Refetch connected realm details even if {REALM_MAP_PATH} is younger than {REALMS_CACHE_TTL.days} days.")
+    parser.add_argument("--format", choices=("json", "columnar"), default=SNAPSHOT_FORMAT,
+                        help="Storage format of the saved auction snapshots.")
+    parser.add_argument("--delta", choices=("emit", "only"),
+                        help="Also write a per-realm delta against the previous snapshot (emit), "
+                             "or store only deltas on top of the last full snapshot (only).")
+    return parser.parse_args()
+
 
 async def main():
+    args = parse_args()
     client_id = os.environ.get("BLIZZARD_CLIENT_ID")
     client_secret = os.environ.get("BLIZZARD_CLIENT_SECRET")
     if not client_id or not client_secret:
         raise Exception("Missing BLIZZARD_CLIENT_ID or BLIZZARD_CLIENT_SECRET environment variables.")
         
-    async with aiohttp.ClientSession() as session:
+    async with create_session() as session:
         # Request OAuth token.
         token = await get_oauth_token(session, client_id, client_secret)
         headers = {"Authorization": f"Bearer {token}"}
@@ -101,53 +375,66 @@ async def main():
             else:
                 print(f"Could not extract realm id from href: {href}")
 
+        # The realm map is needed to filter the realms, so refresh it before fetching any auctions.
+        realm_map = await update_realm_details(session, headers, realm_ids, args.refresh_realms)
+
+        # Unless asked for the whole region, only fetch the connected realms we act on.
+        auction_realm_ids = realm_ids
+        relevant_realms = {} if args.all_realms else load_relevant_realms()
+        if relevant_realms:
+            auction_realm_ids = select_auction_realms(realm_ids, relevant_realms, realm_map)
+            print(f"Fetching {len(auction_realm_ids)} of {len(realm_ids)} connected realms from {RELEVANT_REALMS_FILE}.")
+
+        # Only send conditional requests for realms whose snapshot is still on disk.
+        last_modified = {
+            realm_id: value for realm_id, value in load_last_modified().items()
+            if find_auction_file(SAVE_FOLDER, realm_id) or (realm_id == COMMODITIES_KEY and os.path.exists(COMMODITIES_PATH))
+        }
+
+        # In pipelined mode a bounded queue hands every saved snapshot to the sniper evaluation stage.
+        queue = consumer = None
+        if args.pipeline:
+            queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+            consumer = asyncio.create_task(evaluate_snapshots(queue))
+
         # Create a task for each realm request.
+        fetches = {
+            realm_id: get_auctions_for_realm(session, realm_id, headers, last_modified.get(realm_id), args.format, args.delta)
+            for realm_id in auction_realm_ids
+        }
+        if args.commodities:
+            fetches[COMMODITIES_KEY] = get_commodities(session, headers, last_modified.get(COMMODITIES_KEY))
+        snapshot_keys = list(fetches)
         tasks = [
-            asyncio.create_task(get_auctions_for_realm(session, realm_id, headers))
-            for realm_id in realm_ids
+            asyncio.create_task(queue_when_fetched(fetch, queue, key) if queue else fetch)
+            for key, fetch in fetches.items()
         ]
         
-        # Gather all results concurrently.
-        auctions_results = await asyncio.gather(*tasks, return_exceptions=True)
+        # Gather all results concurrently. Each task streams its realm to disk as it arrives.
+        with report.stage("fetch_snapshots"):
+            auctions_results = await asyncio.gather(*tasks, return_exceptions=True)
+        if consumer:
+            with report.stage("pipeline_drain"):
+                await queue.put(None)
+                await consumer
         
-        # Save auction data per realm.
-        for realm_id, auctions_data in zip(realm_ids, auctions_results):
-            if isinstance(auctions_data, Exception):
-                print(f"Error fetching realm {realm_id}: {auctions_data}")
-            else:
-                if "auctions" in auctions_data:
-                    auctions_data["auctions"] = sorted(auctions_data["auctions"], key=lambda a: a["item"]["id"])
-                filename = f"{SAVE_FOLDER}{realm_id}.json"
-                os.makedirs(os.path.dirname(filename), exist_ok=True)
-                with open(filename, "w") as f:
-                    json.dump(auctions_data, f, indent=2)
-                print(f"Saved auctions data for realm {realm_id} to {filename}")
-
-        # Create tasks for connected realm details
-        connected_realm_tasks = [
-            asyncio.create_task(get_connected_realm_details(session, realm_id, headers))
-            for realm_id in realm_ids
-        ]
-        # Gather connected realm details concurrently.
-        connected_realm_results = await asyncio.gather(*connected_realm_tasks, return_exceptions=True)
-        # Build a dictionary mapping each connected realm id to the list of realm names.
-        connected_realms_data = {}
-        for realm_id, result in zip(realm_ids, connected_realm_results):
+        # Record the snapshot version of every realm that was saved.
+        for realm_id, result in zip(snapshot_keys, auctions_results):
             if isinstance(result, Exception):
-                print(f"Error fetching connected realm {realm_id}: {result}")
+                print(f"Error fetching realm {realm_id}: {result}")
+                continue
+            count, modified = result
+            if count is None:
+                # 304 Not Modified: the saved snapshot is still current.
+                continue
+            if modified:
+                last_modified[realm_id] = modified
             else:
-                # Convert the main realm id to string to use as a JSON key.
-                main_realm_id = str(result.get("id"))
-                realm_names = [realm["name"] for realm in result.get("realms", [])]
-                connected_realms_data[main_realm_id] = realm_names
-
-        # Save the connected realms data to data/connected-realms.json
-
-        os.makedirs(os.path.dirname(REALMS_PATH), exist_ok=True)
-        with open(REALMS_PATH, "w") as f:
-            json.dump(connected_realms_data, f, indent=2)
-        print(f"Saved connected realms data to {REALMS_PATH}")
-
+                last_modified.pop(realm_id, None)
+        save_last_modified(last_modified)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    try:
+        asyncio.run(main())
+    finally:
+        report.write("auctionDataRequest")
\ No newline at end of file
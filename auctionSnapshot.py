@@ -0,0 +1,659 @@
+import os
+import sys
+import json
+import zlib
+import struct
+import asyncio
+import datetime
+from array import array
+from jsonBackend import DecodeError, auction_row, decode_auction_row, loads
+from runReport import report
+
+# Read size used when streaming auction files and HTTP bodies.
+CHUNK_SIZE = 64 * 1024
+# First key of files written by write_auctions_file: one auction per line, so each line can be
+# decoded on its own. Raw API bodies are a single compact line and are never read that way.
+AUCTION_LINES_KEY = "auction_lines"
+
+# Columnar snapshot container: magic, then a zlib stream holding a length-prefixed
+# JSON header followed by the little-endian column arrays listed in SNAPSHOT_COLUMNS.
+SNAPSHOT_SUFFIX = ".snap"
+SNAPSHOT_MAGIC = b"ASNAP1\n"
+SNAPSHOT_COMPRESSION_LEVEL = 6
+SNAPSHOT_COLUMNS = (
+    ("auction_id", "q"),
+    ("item_id", "i"),
+    ("buyout", "q"),
+    ("quantity", "i"),
+    ("time_left", "B"),
+    ("bonus_offsets", "I"),  # bonus_lists of row n are bonus_values[offsets[n]:offsets[n + 1]]
+    ("bonus_values", "I"),
+)
+TIME_LEFT_VALUES = ("", "SHORT", "MEDIUM", "LONG", "VERY_LONG")
+
+# Per-realm deltas live in {auctions dir}/deltas/{realm_id}/{snapshot_id}.delta as zlib-compressed JSON.
+DELTA_DIR = "deltas"
+DELTA_SUFFIX = ".delta"
+# "only" mode writes a new full snapshot once a realm's delta chain reaches this length.
+MAX_DELTA_CHAIN = 72
+# "emit" mode keeps this many of the newest deltas per realm.
+DELTA_HISTORY_LIMIT = 72
+
+
+class _JsonStream:
+    """
+    Minimal incremental reader over a JSON text file.
+    Keeps a rolling buffer so only the value currently being decoded is held in memory.
+    """
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        chunk = self.f.read(CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        if self.pos:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        self.buf += chunk
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it ("" at end of file)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} but found {found!r}")
+        self.pos += 1
+
+    def line_value(self, fast):
+        """
+        Decode the next value with fast if it is an object on a line of its own, as written by
+        write_auctions_file. Returns None if it is not or fast fails on it.
+        The line end is only looked for within one chunk, so a long line is never copied.
+        """
+        end = self.buf.find("\n", self.pos, self.pos + CHUNK_SIZE)
+        while end == -1 and len(self.buf) - self.pos < CHUNK_SIZE and self._fill():
+            end = self.buf.find("\n", self.pos, self.pos + CHUNK_SIZE)
+        if end == -1:
+            end = len(self.buf) if self.eof else -1
+        if end == -1:
+            return None
+        line = self.buf[self.pos:end].rstrip()
+        if line.endswith(","):
+            line = line[:-1].rstrip()
+        if not line.endswith("}"):
+            return None
+        try:
+            value = fast(line)
+        except DecodeError:
+            return None
+        self.pos += len(line)
+        return value
+
+    def value(self, fast=None, convert=None):
+        """
+        Decode the next complete JSON value.
+        fast is tried first on objects that fit on one line (see line_value);
+        convert is applied to values decoded the slow way so both give the same result.
+        """
+        if fast is not None and self.peek() == "{":
+            value = self.line_value(fast)
+            if value is not None:
+                return value
+        value = self.raw_value()
+        return convert(value) if convert is not None else value
+
+    def raw_value(self):
+        """Decode the next complete JSON value with the stdlib decoder."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number at the very end of the buffer may continue in the next chunk.
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+
+def _iter_top_level(f, header, fast=loads, convert=None):
+    """
+    Walk the top-level object of an auction file, storing every key except
+    "auctions" (and AUCTION_LINES_KEY) in header and yielding the auctions one at a time.
+    In files written by write_auctions_file auctions are decoded with fast and convert,
+    see _JsonStream.value; in any other file with the stdlib decoder.
+    """
+    stream = _JsonStream(f)
+    stream.expect("{")
+    if stream.peek() == "}":
+        return
+    lines = False
+    while True:
+        key = stream.value()
+        stream.expect(":")
+        if key == AUCTION_LINES_KEY:
+            lines = stream.value() is True
+        elif key == "auctions":
+            stream.expect("[")
+            if stream.peek() == "]":
+                stream.pos += 1
+            else:
+                while True:
+                    yield stream.value(fast if lines else None, convert)
+                    if stream.peek() == ",":
+                        stream.pos += 1
+                        continue
+                    stream.expect("]")
+                    break
+        else:
+            header[key] = stream.value()
+        if stream.peek() == ",":
+            stream.pos += 1
+            continue
+        stream.expect("}")
+        return
+
+
+def iter_auctions(path, header=None):
+    """
+    Yield the auctions of an auction JSON file one at a time without loading the whole file.
+    If a dict is passed as header it is filled with the remaining top-level keys
+    (e.g. "connected_realm") as they are encountered.
+    """
+    if header is None:
+        header = {}
+    with open(path, "r", encoding="utf-8") as f:
+        yield from _iter_top_level(f, header)
+
+
+def read_header(path):
+    """
+    Return the top-level keys that precede the auctions array, without decoding any auction.
+    """
+    header = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for _ in _iter_top_level(f, header):
+            break
+    return header
+
+
+def write_auctions_file(path, header, auctions, trailer=None):
+    """
+    Write an auction file with one compact auction per line, streaming from an iterable,
+    marked with AUCTION_LINES_KEY so readers may decode it line by line.
+    header keys are written before the auctions array; keys only present in trailer
+    (filled while the auctions are consumed) are written after it.
+    The file is replaced atomically so readers never see a partial snapshot.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(f"{{\n  {json.dumps(AUCTION_LINES_KEY)}: true,")
+        for key, value in header.items():
+            if key != AUCTION_LINES_KEY:
+                f.write(f"\n  {json.dumps(key)}: {json.dumps(value)},")
+        f.write('\n  "auctions": [')
+        separator = "\n    "
+        for auction in auctions:
+            f.write(separator)
+            f.write(json.dumps(auction, separators=(",", ":")))
+            separator = ",\n    "
+        f.write("\n  ]")
+        for key, value in (trailer or {}).items():
+            if key not in header and key != AUCTION_LINES_KEY:
+                f.write(f",\n  {json.dumps(key)}: {json.dumps(value)}")
+        f.write("\n}\n")
+    os.replace(tmp_path, path)
+
+
+def normalise_auctions_file(source, path, extra_header=None):
+    """
+    Rewrite a raw auctions response saved at source into path, decoding one auction at a time.
+    extra_header keys (e.g. "snapshot_id") are added to the file's top-level keys.
+    Returns the number of auctions written.
+    """
+    count = 0
+
+    def counted(auctions):
+        nonlocal count
+        for auction in auctions:
+            count += 1
+            yield auction
+
+    trailer = {}
+    header = dict(read_header(source), **(extra_header or {}))
+    write_auctions_file(path, header, counted(iter_auctions(source, trailer)), trailer)
+    return count
+
+
+async def download_auctions(resp, path, delta=None):
+    """
+    Stream an auctions response body to disk in CHUNK_SIZE pieces, then store it with
+    save_snapshot() in a worker thread so other downloads keep flowing.
+    Returns the number of auctions in the snapshot.
+    """
+    part_path = f"{path}.part"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    try:
+        with open(part_path, "wb") as f:
+            async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                f.write(chunk)
+        return await asyncio.to_thread(save_snapshot, part_path, path, delta)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+
+def save_snapshot(source, path, delta=None):
+    """
+    Store the raw auctions response at source as the realm snapshot path.
+    A path ending in SNAPSHOT_SUFFIX produces a columnar snapshot, anything else a
+    normalised JSON file; the realm's file in the other format is removed so readers
+    never pick up a stale copy.
+    delta selects how deltas against the previous snapshot are kept:
+      None   - full snapshot only.
+      "emit" - full snapshot plus a delta file recording what changed.
+      "only" - only a delta file, chained onto the existing full snapshot until the
+               chain reaches MAX_DELTA_CHAIN and a new full snapshot is written.
+    Returns the number of auctions in the snapshot.
+    """
+    realm_id = os.path.splitext(os.path.basename(path))[0]
+    directory = os.path.dirname(path)
+    snapshot_id = new_snapshot_id()
+    previous_path = find_auction_file(directory, realm_id) if delta else None
+    previous = load_snapshot(previous_path) if previous_path else None
+
+    if delta == "only" and previous and previous["snapshot_id"] and len(previous["chain"]) < MAX_DELTA_CHAIN:
+        rows = list(_iter_file_rows(source))
+        write_delta(directory, realm_id, previous["snapshot_id"], previous["current_id"], snapshot_id,
+                    compute_delta(previous["rows"], rows))
+        return len(rows)
+
+    extra_header = {"snapshot_id": snapshot_id}
+    if is_columnar_snapshot(path):
+        count = convert_to_columnar(source, path, extra_header)
+        stale_path = f"{path[:-len(SNAPSHOT_SUFFIX)]}.json"
+    else:
+        count = normalise_auctions_file(source, path, extra_header)
+        stale_path = f"{os.path.splitext(path)[0]}{SNAPSHOT_SUFFIX}"
+    if os.path.exists(stale_path):
+        os.remove(stale_path)
+
+    if delta == "only":
+        # Rebased onto a new full snapshot, the old chain is no longer needed.
+        for delta_path in list_deltas(directory, realm_id):
+            os.remove(delta_path)
+    elif delta == "emit" and previous and previous["current_id"]:
+        write_delta(directory, realm_id, previous["current_id"], previous["current_id"], snapshot_id,
+                    compute_delta(previous["rows"], _iter_file_rows(path)))
+        for delta_path in list_deltas(directory, realm_id)[:-DELTA_HISTORY_LIMIT]:
+            os.remove(delta_path)
+    return count
+
+
+def aggregate_commodities(path):
+    """
+    Aggregate a region commodities payload in one streaming pass.
+    Returns a dict mapping item id (as string) to its minimum unit price, quantity-weighted
+    mean unit price and total listed quantity; individual listings are never kept.
+    """
+    minimum = {}
+    weighted = {}
+    quantities = {}
+    for auction in iter_auctions(path):
+        item_id = auction.get("item", {}).get("id")
+        unit_price = auction.get("unit_price")
+        if item_id is None or unit_price is None:
+            continue
+        quantity = auction.get("quantity", 1)
+        if item_id not in minimum or unit_price < minimum[item_id]:
+            minimum[item_id] = unit_price
+        weighted[item_id] = weighted.get(item_id, 0) + unit_price * quantity
+        quantities[item_id] = quantities.get(item_id, 0) + quantity
+    return {
+        str(item_id): {
+            "min_unit_price": minimum[item_id],
+            "weighted_unit_price": round(weighted[item_id] / quantities[item_id]) if quantities[item_id] else minimum[item_id],
+            "quantity": quantities[item_id],
+        }
+        for item_id in sorted(minimum)
+    }
+
+
+def save_commodities(source, path):
+    """
+    Aggregate the raw commodities response at source and write the per-item prices to path.
+    Returns the number of items.
+    """
+    items = aggregate_commodities(source)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump({"items": items}, f, separators=(",", ":"))
+    os.replace(f"{path}.tmp", path)
+    return len(items)
+
+
+async def download_commodities(resp, path):
+    """
+    Stream the region commodities response to disk and aggregate it in a worker thread.
+    Returns the number of items written to path.
+    """
+    part_path = f"{path}.part"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    try:
+        with open(part_path, "wb") as f:
+            async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                f.write(chunk)
+        return await asyncio.to_thread(save_commodities, part_path, path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+def write_columnar_snapshot(path, header, auctions):
+    """
+    Write auctions as a compressed columnar snapshot holding only the fields the sniper reads:
+    auction id, item id, buyout, quantity, time left and bonus lists.
+    auctions may be any iterable of auction dicts, e.g. iter_auctions().
+    Auctions without an auction id or item id are skipped and counted in the run report.
+    Returns the number of auctions written.
+    """
+    columns = {name: array(typecode) for name, typecode in SNAPSHOT_COLUMNS}
+    time_left_codes = {value: code for code, value in enumerate(TIME_LEFT_VALUES)}
+    columns["bonus_offsets"].append(0)
+    malformed = 0
+    for auction in auctions:
+        item = auction.get("item", {})
+        auction_id, item_id = auction.get("id"), item.get("id")
+        if auction_id is None or item_id is None:
+            malformed += 1
+            continue
+        bonus_lists = item.get("bonus_lists", [])
+        columns["auction_id"].append(auction_id)
+        columns["item_id"].append(item_id)
+        columns["buyout"].append(auction.get("buyout", 0))
+        columns["quantity"].append(auction.get("quantity", 1))
+        columns["time_left"].append(time_left_codes.get(auction.get("time_left", ""), 0))
+        columns["bonus_values"].extend(bonus_lists)
+        columns["bonus_offsets"].append(len(columns["bonus_values"]))
+    if malformed:
+        print(f"Skipped {malformed} auctions without an auction or item id while writing {path}")
+        report.count("auctions_malformed", malformed)
+
+    count = len(columns["auction_id"])
+    header_bytes = json.dumps(dict(header, count=count), separators=(",", ":")).encode("utf-8")
+    compressor = zlib.compressobj(SNAPSHOT_COMPRESSION_LEVEL)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(compressor.compress(struct.pack("<I", len(header_bytes)) + header_bytes))
+        for name, _ in SNAPSHOT_COLUMNS:
+            column = columns[name]
+            if sys.byteorder == "big":
+                column.byteswap()
+            f.write(compressor.compress(struct.pack("<Q", len(column)) + column.tobytes()))
+        f.write(compressor.flush())
+    os.replace(tmp_path, path)
+    return count
+
+
+def read_columnar_snapshot(path):
+    """
+    Read a columnar snapshot.
+    Returns a tuple (header, columns) where columns maps each name in SNAPSHOT_COLUMNS to an array.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not an auction snapshot")
+        data = zlib.decompress(f.read())
+    (header_size,) = struct.unpack_from("<I", data, 0)
+    offset = 4 + header_size
+    header = json.loads(data[4:offset])
+    columns = {}
+    for name, typecode in SNAPSHOT_COLUMNS:
+        (length,) = struct.unpack_from("<Q", data, offset)
+        offset += 8
+        column = array(typecode)
+        size = length * column.itemsize
+        column.frombytes(data[offset:offset + size])
+        offset += size
+        if sys.byteorder == "big":
+            column.byteswap()
+        columns[name] = column
+    return header, columns
+
+
+def read_columnar_header(path):
+    """
+    Return the header of a columnar snapshot, decompressing only as much of the file as it takes.
+    """
+    decompressor = zlib.decompressobj()
+    data = b""
+    header_size = None
+    with open(path, "rb") as f:
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not an auction snapshot")
+        while True:
+            chunk = decompressor.unconsumed_tail or f.read(CHUNK_SIZE)
+            if not chunk:
+                raise ValueError(f"{path} is truncated")
+            data += decompressor.decompress(chunk, CHUNK_SIZE)
+            if header_size is None and len(data) >= 4:
+                (header_size,) = struct.unpack_from("<I", data, 0)
+            if header_size is not None and len(data) >= 4 + header_size:
+                return json.loads(data[4:4 + header_size])
+
+
+def is_columnar_snapshot(path):
+    return path.endswith(SNAPSHOT_SUFFIX)
+
+
+def list_auction_files(directory):
+    """
+    Return one auction file per realm in directory, JSON or columnar.
+    If a realm has both, the more recently written one wins.
+    """
+    latest = {}
+    for name in os.listdir(directory) if os.path.isdir(directory) else ():
+        base, ext = os.path.splitext(name)
+        if ext not in (".json", SNAPSHOT_SUFFIX):
+            continue
+        path = os.path.join(directory, name)
+        if base not in latest or os.path.getmtime(path) > os.path.getmtime(latest[base]):
+            latest[base] = path
+    return sorted(latest.values())
+
+
+def find_auction_file(directory, realm_id):
+    """
+    Return the saved auction file of a realm in either format, or None.
+    """
+    for suffix in (".json", SNAPSHOT_SUFFIX):
+        path = os.path.join(directory, f"{realm_id}{suffix}")
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def read_auction_header(path):
+    """
+    Return the top-level metadata (e.g. "connected_realm") of an auction file in either format.
+    """
+    if is_columnar_snapshot(path):
+        return read_columnar_header(path)
+    return read_header(path)
+
+
+def _iter_file_rows(path):
+    """
+    Yield (auction_id, item_id, buyout, quantity, time_left, bonus_lists) for every auction
+    stored in a single JSON or columnar file, ignoring any deltas.
+    """
+    if is_columnar_snapshot(path):
+        _, columns = read_columnar_snapshot(path)
+        offsets = columns["bonus_offsets"]
+        values = columns["bonus_values"]
+        time_left = [TIME_LEFT_VALUES[code] for code in columns["time_left"]]
+        for n, (auction_id, item_id, buyout, quantity) in enumerate(zip(
+                columns["auction_id"], columns["item_id"], columns["buyout"], columns["quantity"])):
+            yield auction_id, item_id, buyout, quantity, time_left[n], values[offsets[n]:offsets[n + 1]].tolist()
+        return
+    # Decode only the fields of a row, with the typed decoder of the JSON backend if it has one.
+    with open(path, "r", encoding="utf-8") as f:
+        yield from _iter_top_level(f, {}, decode_auction_row, auction_row)
+
+
+def convert_to_columnar(source, path, extra_header=None):
+    """
+    Convert an auction JSON file into a columnar snapshot. Returns the number of auctions.
+    """
+    header = dict(read_header(source), **(extra_header or {}))
+    return write_columnar_snapshot(path, header, iter_auctions(source))
+
+
+def iter_auction_rows(path):
+    """
+    Yield (auction_id, item_id, buyout, quantity, time_left, bonus_lists) for every auction
+    of a realm, reading JSON and columnar snapshots transparently.
+    If the realm has a delta chain on top of this file the rebuilt snapshot is returned;
+    otherwise, e.g. with the deltas kept by --delta emit, the file is streamed.
+    """
+    if not chained_deltas(path, read_auction_header(path).get("snapshot_id")):
+        yield from _iter_file_rows(path)
+        return
+    for auction_id, row in load_snapshot(path)["rows"].items():
+        yield (auction_id,) + row
+
+
+def new_snapshot_id():
+    return datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+
+
+def list_deltas(directory, realm_id):
+    """
+    Return the delta files of a realm, oldest first.
+    """
+    delta_dir = os.path.join(directory, DELTA_DIR, str(realm_id))
+    if not os.path.isdir(delta_dir):
+        return []
+    return sorted(os.path.join(delta_dir, name) for name in os.listdir(delta_dir) if name.endswith(DELTA_SUFFIX))
+
+
+def chained_deltas(path, snapshot_id):
+    """
+    Return the deltas chained onto the full snapshot file path, keyed by from_id.
+    Deltas are named after the snapshot they lead to, so only the ones newer than snapshot_id
+    are read; those kept by "emit" end at or before the current full snapshot.
+    """
+    if not snapshot_id:
+        return {}
+    deltas = {}
+    realm_id = os.path.splitext(os.path.basename(path))[0]
+    for delta_path in list_deltas(os.path.dirname(path), realm_id):
+        if os.path.basename(delta_path)[:-len(DELTA_SUFFIX)] <= snapshot_id:
+            continue
+        delta = read_delta(delta_path)
+        if delta.get("base_id") == snapshot_id:
+            deltas[delta["from_id"]] = (delta_path, delta)
+    return deltas
+
+
+def read_delta(path):
+    with open(path, "rb") as f:
+        return loads(zlib.decompress(f.read()))
+
+
+def write_delta(directory, realm_id, base_id, from_id, snapshot_id, changes):
+    """
+    Write the changes from snapshot from_id to snapshot_id.
+    base_id names the full snapshot the delta chain starts from.
+    """
+    delta_dir = os.path.join(directory, DELTA_DIR, str(realm_id))
+    os.makedirs(delta_dir, exist_ok=True)
+    delta = dict(changes, base_id=base_id, from_id=from_id, id=snapshot_id)
+    path = os.path.join(delta_dir, f"{snapshot_id}{DELTA_SUFFIX}")
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(zlib.compress(json.dumps(delta, separators=(",", ":")).encode("utf-8"), SNAPSHOT_COMPRESSION_LEVEL))
+    os.replace(f"{path}.tmp", path)
+    return path
+
+
+def compute_delta(previous_rows, rows):
+    """
+    Compare a snapshot (dict of auction_id -> row without the id) with new rows.
+    Returns a dict with the "added" rows, the "removed" auction ids and the
+    "changed" auctions as [auction_id, buyout, quantity, time_left].
+    """
+    added = []
+    changed = []
+    seen = set()
+    for auction_id, item_id, buyout, quantity, time_left, bonus_lists in rows:
+        seen.add(auction_id)
+        old = previous_rows.get(auction_id)
+        if old is None:
+            added.append([auction_id, item_id, buyout, quantity, time_left, list(bonus_lists)])
+        elif old[1:4] != (buyout, quantity, time_left):
+            changed.append([auction_id, buyout, quantity, time_left])
+    removed = [auction_id for auction_id in previous_rows if auction_id not in seen]
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+def apply_delta(rows, delta):
+    """
+    Apply a delta in place to a dict of auction_id -> (item_id, buyout, quantity, time_left, bonus_lists).
+    """
+    for auction_id in delta["removed"]:
+        rows.pop(auction_id, None)
+    for auction_id, buyout, quantity, time_left in delta["changed"]:
+        item_id, _, _, _, bonus_lists = rows[auction_id]
+        rows[auction_id] = (item_id, buyout, quantity, time_left, bonus_lists)
+    for auction_id, item_id, buyout, quantity, time_left, bonus_lists in delta["added"]:
+        rows[auction_id] = (item_id, buyout, quantity, time_left, bonus_lists)
+    return rows
+
+
+def rebuild_snapshot(base_path, delta_paths):
+    """
+    Rebuild a full snapshot from a base file plus an ordered list of delta files.
+    Returns a dict of auction_id -> (item_id, buyout, quantity, time_left, bonus_lists).
+    """
+    rows = {row[0]: row[1:] for row in _iter_file_rows(base_path)}
+    for delta_path in delta_paths:
+        apply_delta(rows, read_delta(delta_path))
+    return rows
+
+
+def load_snapshot(path):
+    """
+    Load the current snapshot of a realm: its full file plus the deltas chained onto it.
+    Returns a dict with the base "snapshot_id", the applied delta "chain", the
+    "current_id" after applying it and the rebuilt "rows".
+    """
+    snapshot_id = read_auction_header(path).get("snapshot_id")
+    deltas = chained_deltas(path, snapshot_id)
+    rows = {row[0]: row[1:] for row in _iter_file_rows(path)}
+    chain = []
+    current_id = snapshot_id
+    while current_id in deltas:
+        delta_path, delta = deltas.pop(current_id)
+        apply_delta(rows, delta)
+        chain.append(delta_path)
+        current_id = delta["id"]
+    return {"snapshot_id": snapshot_id, "chain": chain, "current_id": current_id, "rows": rows}
@@ -0,0 +1,260 @@
+import os
+import sys
+import json
+import time
+import random
+import datetime
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from auctionSnapshot import list_auction_files, write_auctions_file, write_columnar_snapshot, SNAPSHOT_SUFFIX
+
+# Today's scale (1x): connected realm files per run and auctions per realm file.
+BASE_REALMS = 12
+BASE_AUCTIONS_PER_REALM = 7500
+# Distinct bonus-list combinations to draw from, and the share of auctions carrying one.
+BONUS_LIST_POOL = 3000
+BONUS_LIST_RATE = 0.35
+# Share of auctions listed far below their item's price, and at what share of it, so there are
+# candidates to evaluate: below THRESHOLD_RATIO of the history, and often above MIN_BUYOUT.
+BARGAIN_RATE = 0.005
+BARGAIN_DISCOUNT = 0.1
+TIME_LEFT_VALUES = ("SHORT", "MEDIUM", "LONG", "VERY_LONG")
+ITEM_CATALOG_SAMPLE = 20000
+FIRST_REALM_ID = 9000
+# Spacing of the synthetic history, like the scheduled workflow.
+RUN_INTERVAL = datetime.timedelta(minutes=20)
+# Multiples of today's scale run by default, and with --quick.
+DEFAULT_SCALES = "1,10,100"
+QUICK_SCALES = "1,10"
+
+
+def item_pool(rng, size):
+    """
+    Item ids with a base price and popularity weight, taken from the item catalog when there is one
+    so item lookups and presets behave like in production, synthetic ids otherwise.
+    """
+    import sniper
+    item_ids = sorted(sniper.load_item_catalog()) or list(range(1, size + 1))
+    item_ids = rng.sample(item_ids, min(size, len(item_ids)))
+    prices = [int(rng.lognormvariate(16, 2.5)) + 1 for _ in item_ids]
+    # Zipf-like popularity: a few items are listed on every realm, most only a few times.
+    weights = [1.0 / rank for rank in range(1, len(item_ids) + 1)]
+    return item_ids, prices, weights
+
+
+def bonus_list_pool(rng, size):
+    """Distinct bonus lists drawn from the ids in BonusIds.json (or a synthetic range)."""
+    import sniper
+    bonus_ids = sorted(sniper.load_bonus_table()[1]) or list(range(1, 5000))
+    return [sorted(rng.sample(bonus_ids, rng.randint(1, min(4, len(bonus_ids))))) for _ in range(size)]
+
+
+def generate_snapshots(directory, realms, auctions_per_realm, seed, snapshot_format="json",
+                       bonus_rate=BONUS_LIST_RATE, bonus_pool=BONUS_LIST_POOL):
+    """
+    Write deterministic synthetic realm snapshots to directory, in the format auctionDataRequest.py saves.
+    Returns the list of realm ids.
+    """
+    rng = random.Random(seed)
+    item_ids, prices, weights = item_pool(rng, ITEM_CATALOG_SAMPLE)
+    bonus_lists = bonus_list_pool(rng, bonus_pool)
+    bonus_weights = [1.0 / rank for rank in range(1, len(bonus_lists) + 1)]
+    os.makedirs(directory, exist_ok=True)
+    realm_ids = [str(FIRST_REALM_ID + n) for n in range(realms)]
+    auction_id = 100000000
+    for realm_id in realm_ids:
+        picks = rng.choices(range(len(item_ids)), weights, k=auctions_per_realm)
+        auctions = []
+        for pick in picks:
+            auction_id += 1
+            price = prices[pick] * rng.uniform(0.7, 1.6)
+            if rng.random() < BARGAIN_RATE:
+                price *= BARGAIN_DISCOUNT
+            item = {"id": item_ids[pick], "context": rng.randint(0, 60)}
+            if rng.random() < bonus_rate:
+                item["bonus_lists"] = rng.choices(bonus_lists, bonus_weights)[0]
+            auctions.append({
+                "id": auction_id,
+                "item": item,
+                "buyout": int(price) // 100 * 100,
+                "quantity": 1,
+                "time_left": rng.choice(TIME_LEFT_VALUES),
+            })
+        header = {"connected_realm": {"href": f"https://eu.api.blizzard.com/data/wow/connected-realm/{realm_id}?namespace=dynamic-eu"}}
+        if snapshot_format == "columnar":
+            write_columnar_snapshot(os.path.join(directory, f"{realm_id}{SNAPSHOT_SUFFIX}"), header, auctions)
+        else:
+            write_auctions_file(os.path.join(directory, f"{realm_id}.json"), header, auctions)
+    return realm_ids
+
+
+def generate_history(conn, files, relevant_realms, runs, seed):
+    """
+    Fill auctions.db with runs earlier observations of the snapshots' variants through the same
+    insert path the sniper uses. Prices are jittered around the undiscounted item prices of
+    generate_snapshots with the same seed, so the bargains in the snapshots stand out against them.
+    """
+    import sniper
+    item_ids, prices, _ = item_pool(random.Random(seed), ITEM_CATALOG_SAMPLE)
+    item_prices = dict(zip(item_ids, prices))
+    variants = set()
+    for file in files:
+        file_minima, _, _ = sniper.aggregate_file(file, relevant_realms)
+        variants.update(file_minima)
+    rng = random.Random(seed)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for run in range(runs):
+        # One run every RUN_INTERVAL, ending just before now.
+        timestamp = (now - (runs - run) * RUN_INTERVAL).isoformat()
+        batch = {key: int(item_prices[key[1]] * rng.uniform(0.7, 1.1)) for key in variants}
+        sniper.insert_prices(conn, batch, timestamp)
+    return len(variants)
+
+
+def measure(stage, func, repeat_for_memory=True, memory_func=None, memory_scope="main process"):
+    """
+    Run func once timed and, unless disabled, once more under tracemalloc for its peak memory.
+    tracemalloc only sees this process, memory_scope labels what the peak covers.
+    memory_func replaces func in the memory pass, e.g. to run a stage that writes to the database
+    on a copy of it.
+    Returns (result, stats) where stats holds wall and CPU seconds, peak MiB and its scope.
+    """
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    result = func()
+    stats = {"wall_s": time.perf_counter() - start_wall, "cpu_s": time.process_time() - start_cpu}
+    if repeat_for_memory:
+        tracemalloc.start()
+        (memory_func or func)()
+        stats["peak_mib"] = tracemalloc.get_traced_memory()[1] / (1 << 20)
+        stats["peak_scope"] = memory_scope
+        tracemalloc.stop()
+    print(f"  {stage:<24} {stats['wall_s']:8.3f}s wall {stats['cpu_s']:8.3f}s cpu"
+          + (f" {stats['peak_mib']:9.1f} MiB peak ({stats['peak_scope']})" if "peak_mib" in stats else ""))
+    return result, stats
+
+
+def run_scale(scale, args, workdir):
+    """Generate one scale's data set in workdir and time every stage on it."""
+    import sniper
+    realms = max(1, round(args.realms * scale))
+    auctions_per_realm = args.auctions_per_realm
+    auctions_dir = os.path.join(workdir, "auctions")
+    print(f"{scale}x: {realms} realms x {auctions_per_realm} auctions, {args.history_runs} runs of history")
+    generate_snapshots(auctions_dir, realms, auctions_per_realm, args.seed, args.format)
+    files = list_auction_files(auctions_dir)
+    relevant_realms = {os.path.basename(file).split(".")[0]: "Benchmark" for file in files}
+    total_auctions = realms * auctions_per_realm
+    memory = not args.no_memory
+
+    conn = sniper.connect_db(os.path.join(workdir, "auctions.db"))
+    sniper.init_db(conn)
+    sniper.init_announced_db(conn)
+    variants = generate_history(conn, files, relevant_realms, args.history_runs, args.seed)
+    reference = sniper.load_reference_data()
+    _, expansion_data, expansion_presets, latest_expansion, eligibility = reference
+    if args.presets == "none":
+        expansion_presets = {}
+        eligibility = sniper.compile_eligibility(expansion_data, expansion_presets, latest_expansion)
+
+    results = {"scale": scale, "realms": realms, "auctions": total_auctions, "variants": variants, "stages": {}}
+    stages = results["stages"]
+
+    _, stats = measure("parse_file", lambda: sum(1 for _ in sniper.parse_file(files[0])), memory)
+    stats["auctions_per_s"] = auctions_per_realm / stats["wall_s"]
+    stages["parse_file"] = stats
+
+    # process_files stores the snapshot's prices; its memory pass writes to a copy of the database
+    # so the history get_historical_averages reads holds the snapshot only once.
+    # The memory pass parses in this process: tracemalloc cannot see the memory of parse workers.
+    scratch_path = os.path.join(workdir, "scratch.db")
+    scratch = sniper.connect_db(scratch_path) if memory else None
+    if scratch is not None:
+        conn.backup(scratch)
+    records, stats = measure(
+        "process_files", lambda: sniper.process_files(conn, relevant_realms, files, eligibility, args.workers), memory,
+        lambda: sniper.process_files(scratch, relevant_realms, files, eligibility, workers=1), "main process, workers=1")
+    if scratch is not None:
+        scratch.close()
+        for path in (scratch_path, f"{scratch_path}-wal", f"{scratch_path}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+    stats["auctions_per_s"] = total_auctions / stats["wall_s"]
+    stages["process_files"] = stats
+
+    keys = {(record.item_id, sniper.get_bonus_key(record.bonus_lists)) for record in records}
+    averages, stats = measure("get_historical_averages", lambda: sniper.get_historical_averages(conn, keys), memory)
+    stats["variants_per_s"] = len(keys) / stats["wall_s"]
+    stages["get_historical_averages"] = stats
+
+    cheap, stats = measure("find_cheap_items", lambda: sniper.find_cheap_items(
+        records, averages, relevant_realms, expansion_data, expansion_presets, set(), latest_expansion, eligibility), memory)
+    stats["records_per_s"] = len(records) / stats["wall_s"]
+    stages["find_cheap_items"] = stats
+
+    item_ids = sorted({record.item_id for record in records})
+
+    def load_items():
+        # Cold caches: the first lookup loads the catalog.
+        sniper.load_item_catalog.cache_clear()
+        sniper.load_item_file.cache_clear()
+        for item_id in item_ids:
+            sniper.load_item_data(item_id)
+    _, stats = measure("load_item_data", load_items, memory)
+    stats["items_per_s"] = len(item_ids) / stats["wall_s"]
+    stages["load_item_data"] = stats
+
+    results["records_kept"] = len(records)
+    results["candidates"] = len(cheap)
+    conn.close()
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Time the sniper hot paths on deterministic synthetic data, offline.")
+    parser.add_argument("--scales", default=DEFAULT_SCALES,
+                        help=f"Comma separated multiples of today's realm count to run (default {DEFAULT_SCALES}).")
+    parser.add_argument("--quick", action="store_const", const=QUICK_SCALES, dest="scales",
+                        help=f"Only run the {QUICK_SCALES} scales, for a quick check.")
+    parser.add_argument("--realms", type=int, default=BASE_REALMS, help="Realm files at 1x.")
+    parser.add_argument("--auctions-per-realm", type=int, default=BASE_AUCTIONS_PER_REALM)
+    parser.add_argument("--history-runs", type=int, default=10,
+                        help="Earlier runs of prices stored in the synthetic auctions.db.")
+    parser.add_argument("--format", choices=("json", "columnar"), default="json", help="Snapshot format to generate.")
+    parser.add_argument("--presets", choices=("none", "config"), default="none",
+                        help="none makes every item eligible (the worst case), config uses config/itemClasses.json.")
+    parser.add_argument("--workers", type=int, default=None, help="process_files workers (PARSE_WORKERS by default).")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass of every stage.")
+    parser.add_argument("--keep", metavar="DIR", help="Generate into DIR and keep it instead of a temporary directory.")
+    parser.add_argument("--output", metavar="FILE", help="Also write the results as JSON to FILE.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # Reference data (config, item catalog, bonus ids) is read from the repository, so run from its root.
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    import sniper
+    # Notifications never leave the machine.
+    sniper.DISCORD_WEBHOOK_URL = None
+
+    results = []
+    for scale in (float(value) for value in args.scales.split(",")):
+        scale = int(scale) if scale.is_integer() else scale
+        workdir = os.path.join(args.keep, f"{scale}x") if args.keep else tempfile.mkdtemp(prefix="sniper-benchmark-")
+        try:
+            results.append(run_scale(scale, args, workdir))
+        finally:
+            if not args.keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
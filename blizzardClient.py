@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import asyncio
+import contextlib
+import aiohttp
+from jsonBackend import loads
+from runReport import endpoint_name, report
+
+# Blizzard allows 100 requests per second per client; stay a little below it.
+REQUESTS_PER_SECOND = 90
+MAX_RETRIES = 5
+# After a 429 the reduced rate is kept this many seconds before successful requests raise it again.
+THROTTLE_COOLDOWN = 60
+# X-RateLimit-Reset values above this are epoch timestamps rather than seconds until the reset.
+MAX_RESET_SECONDS = 3600
+
+# Both can point at a local stand-in API for testing, see fakeBlizzardApi.py.
+API_BASE_URL = os.environ.get("BLIZZARD_API_URL", "https://eu.api.blizzard.com")
+OAUTH_TOKEN_URL = os.environ.get("BLIZZARD_OAUTH_URL", "https://eu.battle.net/oauth/token")
+# Cached OAuth token, never commit this file.
+TOKEN_CACHE_FILE = ".blizzard-token.json"
+# Refresh the cached token when it has less than this many seconds left.
+TOKEN_EXPIRY_MARGIN = 300
+
+# Connection pool tuning, all requests go to a handful of hosts.
+CONNECTION_LIMIT = 100
+CONNECTION_LIMIT_PER_HOST = 64
+DNS_CACHE_TTL = 600
+KEEPALIVE_TIMEOUT = 60
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 120
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter for a single asyncio event loop.
+    Every acquire() reserves a token straight away, letting the balance go negative;
+    the caller then sleeps until its reservation is covered, so no lock is needed
+    and concurrent callers are spaced out evenly instead of being serialised.
+    The bucket starts empty and holds capacity tokens at most, so no one-second window sees more
+    than rate + capacity requests; keep rate + capacity below Blizzard's per-second limit.
+    The rate backs off on 429s and, after THROTTLE_COOLDOWN, recovers gradually with successful requests.
+    """
+    def __init__(self, rate, capacity=1):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.cooldown_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        wait = max(-self.tokens / self.rate, self.blocked_until - now)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def throttle(self, retry_after, now=None):
+        """Pause all callers for retry_after seconds and halve the request rate for THROTTLE_COOLDOWN."""
+        now = now if now is not None else time.monotonic()
+        self._refill(now)
+        self.blocked_until = max(self.blocked_until, now + retry_after)
+        self.cooldown_until = max(self.cooldown_until, self.blocked_until + THROTTLE_COOLDOWN)
+        self.rate = max(1.0, self.rate / 2)
+        self.tokens = min(self.tokens, 0)
+
+    def update(self, headers, now=None):
+        """
+        Adjust to the rate-limit headers of a successful response.
+        Once less than max_rate requests of the reported quota remain, they are spread until it resets;
+        otherwise the rate creeps back towards max_rate, unless a 429 is more recent than THROTTLE_COOLDOWN.
+        """
+        now = now if now is not None else time.monotonic()
+        quota_rate = self.quota_rate(headers)
+        cooling_down = now < self.cooldown_until
+        if quota_rate is not None:
+            self.rate = min(self.rate, quota_rate) if cooling_down else quota_rate
+        elif not cooling_down and self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + 1)
+
+    def quota_rate(self, headers):
+        """
+        The rate X-RateLimit-Remaining and X-RateLimit-Reset allow, bounded to [1, max_rate], or None if they
+        are missing or leave at least max_rate requests. Reset may be seconds left or an epoch timestamp.
+        """
+        try:
+            remaining = float(headers["X-RateLimit-Remaining"])
+            reset = float(headers.get("X-RateLimit-Reset", 1))
+        except (KeyError, ValueError):
+            return None
+        if remaining >= self.max_rate:
+            return None
+        if reset > MAX_RESET_SECONDS:
+            reset -= time.time()
+        return max(1.0, min(self.max_rate, remaining / max(reset, 1.0)))
+
+
+rate_limiter = TokenBucket(REQUESTS_PER_SECOND)
+
+
+def get_retry_after(headers, attempt):
+    """
+    Seconds to wait after a 429: the Retry-After header if present,
+    otherwise the rest of the current second with exponential growth per attempt.
+    """
+    try:
+        return max(float(headers.get("Retry-After")), 0.0)
+    except (TypeError, ValueError):
+        return min(1.0 * 2 ** (attempt - 1), 30.0)
+
+
+def create_session():
+    """
+    Create an aiohttp session with a pooled keep-alive connector and DNS cache.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=CONNECTION_LIMIT,
+        limit_per_host=CONNECTION_LIMIT_PER_HOST,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+    )
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+def load_cached_token(client_id):
+    try:
+        with open(TOKEN_CACHE_FILE, "r") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get("client_id") != client_id:
+        return None
+    if cached.get("expires_at", 0) - time.time() < TOKEN_EXPIRY_MARGIN:
+        return None
+    return cached.get("access_token")
+
+
+def save_cached_token(client_id, token, expires_in):
+    cached = {"client_id": client_id, "access_token": token, "expires_at": time.time() + expires_in}
+    # Only the current user may read the token.
+    fd = os.open(TOKEN_CACHE_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(cached, f)
+
+
+async def get_oauth_token(session, client_id, client_secret):
+    """
+    Return an OAuth token for the Blizzard client credentials.
+    Tokens are cached in TOKEN_CACHE_FILE until shortly before they expire.
+    """
+    token = load_cached_token(client_id)
+    if token:
+        return token
+    data = {"grant_type": "client_credentials"}
+    async with session.post(OAUTH_TOKEN_URL, data=data, auth=aiohttp.BasicAuth(client_id, client_secret)) as resp:
+        resp.raise_for_status()
+        token_data = await resp.json()
+        token = token_data.get("access_token")
+        if not token:
+            raise Exception("Could not retrieve access token.")
+    try:
+        save_cached_token(client_id, token, token_data.get("expires_in", 0))
+    except OSError as e:
+        print(f"Could not cache access token: {e}")
+    return token
+
+
+@contextlib.asynccontextmanager
+async def request(session, url, headers=None, retries=MAX_RETRIES):
+    """
+    Rate limited GET request, retried on 429.
+    Yields the response so callers can stream the body or handle 304 themselves;
+    status checking is left to the caller.
+    """
+    endpoint = endpoint_name(url)
+    for attempt in range(1, retries + 1):
+        await rate_limiter.acquire()
+        start = time.perf_counter()
+        resp = await session.get(url, headers=headers)
+        # Time to response headers; bodies are streamed by the caller.
+        report.observe_http(endpoint, time.perf_counter() - start, resp.status)
+        try:
+            if resp.status == 429:
+                # Slow down every caller, also when this was the last attempt.
+                retry_after = get_retry_after(resp.headers, attempt)
+                rate_limiter.throttle(retry_after)
+                if attempt < retries:
+                    print(f"Rate limited on {url}, retrying in {retry_after:.1f}s")
+                    continue
+            else:
+                rate_limiter.update(resp.headers)
+            yield resp
+            return
+        finally:
+            resp.release()
+
+
+async def fetch_json(session, url, headers=None, retries=MAX_RETRIES):
+    """
+    Fetch JSON data from the URL with rate limiting and 429 retries.
+    """
+    async with request(session, url, headers, retries) as resp:
+        resp.raise_for_status()
+        return await resp.json(loads=loads)
@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import argparse
+from email.utils import formatdate, parsedate_to_datetime
+from aiohttp import web
+from auctionSnapshot import iter_auctions
+
+# Seconds between two snapshots of a realm; Blizzard publishes about once an hour.
+DEFAULT_INTERVAL = 60
+DEFAULT_PORT = 8765
+# Auction ids of every new snapshot are shifted by this much, so each snapshot lists new auctions.
+AUCTION_ID_STRIDE = 10 ** 9
+
+
+class FakeApi:
+    """
+    A local stand-in for the Blizzard endpoints the scripts use, serving the auction JSON files
+    of a directory (data/auctions by default) as connected realms.
+    Every realm publishes a new snapshot every interval seconds, staggered across the realms,
+    and answers conditional requests with 304 like the real API.
+    """
+    def __init__(self, directory, interval):
+        self.interval = interval
+        self.started = time.time()
+        self.realms = {}  # realm_id -> (header, auctions)
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".json") or not os.path.splitext(name)[0].isdigit():
+                continue
+            header = {}
+            auctions = list(iter_auctions(os.path.join(directory, name), header))
+            self.realms[os.path.splitext(name)[0]] = (header, auctions)
+        self.offsets = {realm_id: n * interval / len(self.realms) for n, realm_id in enumerate(self.realms)}
+        self.bodies = {}  # realm_id -> (version, body)
+
+    def version(self, realm_id, now=None):
+        """
+        The current snapshot version of a realm and when it was published. Version 0 is the one
+        published a full interval before version 1, so every realm keeps a regular cadence.
+        """
+        elapsed = (now or time.time()) - self.started - self.offsets[realm_id]
+        version = int(elapsed // self.interval) + 1
+        return version, self.started + self.offsets[realm_id] + (version - 1) * self.interval
+
+    def body(self, realm_id, version):
+        cached = self.bodies.get(realm_id)
+        if cached and cached[0] == version:
+            return cached[1]
+        header, auctions = self.realms[realm_id]
+        shift = version * AUCTION_ID_STRIDE
+        body = json.dumps(dict(header, auctions=[dict(auction, id=auction["id"] + shift) for auction in auctions])).encode()
+        self.bodies[realm_id] = (version, body)
+        return body
+
+    async def token(self, request):
+        return web.json_response({"access_token": "fake-token", "token_type": "bearer", "expires_in": 86399})
+
+    async def realm_index(self, request):
+        base = f"{request.scheme}://{request.host}"
+        return web.json_response({"connected_realms": [
+            {"href": f"{base}/data/wow/connected-realm/{realm_id}?namespace=dynamic-eu"} for realm_id in self.realms
+        ]})
+
+    async def realm_details(self, request):
+        realm_id = request.match_info["realm_id"]
+        if realm_id not in self.realms:
+            raise web.HTTPNotFound()
+        return web.json_response({"id": int(realm_id), "realms": [{"id": int(realm_id), "name": f"Realm {realm_id}"}]})
+
+    async def auctions(self, request):
+        realm_id = request.match_info["realm_id"]
+        if realm_id not in self.realms:
+            raise web.HTTPNotFound()
+        version, published = self.version(realm_id)
+        last_modified = formatdate(published, usegmt=True)
+        since = request.headers.get("If-Modified-Since")
+        if since:
+            try:
+                if parsedate_to_datetime(since).timestamp() >= int(published):
+                    return web.Response(status=304, headers={"Last-Modified": last_modified})
+            except (TypeError, ValueError):
+                pass
+        return web.Response(body=self.body(realm_id, version), content_type="application/json",
+                            headers={"Last-Modified": last_modified})
+
+    async def commodities(self, request):
+        return web.json_response({"auctions": []}, headers={"Last-Modified": formatdate(self.started, usegmt=True)})
+
+
+def create_app(directory, interval):
+    api = FakeApi(directory, interval)
+    app = web.Application()
+    app.router.add_post("/oauth/token", api.token)
+    app.router.add_get("/data/wow/connected-realm/", api.realm_index)
+    app.router.add_get("/data/wow/connected-realm/{realm_id}", api.realm_details)
+    app.router.add_get("/data/wow/connected-realm/{realm_id}/auctions", api.auctions)
+    app.router.add_get("/data/wow/auctions/commodities", api.commodities)
+    print(f"Serving {len(api.realms)} realms from {directory}, a new snapshot per realm every {interval}s.")
+    return app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Serve auction snapshots like the Blizzard API, for running the scripts locally. "
+                    "Point them at it with BLIZZARD_API_URL=http://127.0.0.1:PORT "
+                    "and BLIZZARD_OAUTH_URL=http://127.0.0.1:PORT/oauth/token.")
+    parser.add_argument("--auctions-dir", default=os.path.join("data", "auctions"),
+                        help="Directory of realm auction JSON files to serve, e.g. written by benchmark.py --keep.")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="Seconds between snapshots of a realm.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    web.run_app(create_app(args.auctions_dir, args.interval), host="127.0.0.1", port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import jsonBackend
+
+ITEMS_DIR = os.path.join("data", "items")
+# Indexed catalog of the item fields the sniper uses, compiled from ITEMS_DIR.
+CATALOG_FILE = os.path.join("data", "itemCatalog.db")
+CATALOG_LANG = "en_US"
+
+
+def localized(val, lang=CATALOG_LANG):
+    if isinstance(val, dict):
+        return val.get(lang, "")
+    elif isinstance(val, str):
+        return val
+    return ""
+
+
+def init_catalog(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS items (
+            item_id INTEGER PRIMARY KEY,
+            name TEXT,
+            item_class TEXT,
+            item_subclass TEXT,
+            quality TEXT,
+            level INTEGER,
+            icon_path TEXT
+        );
+    """)
+
+
+def catalog_row(item_id, item_data):
+    """Reduce a full item API response to a catalog row."""
+    def name_of(field):
+        value = item_data.get(field)
+        return localized(value.get("name", "")) if isinstance(value, dict) else ""
+    return (
+        int(item_id),
+        localized(item_data.get("name", "Unknown Item")),
+        name_of("item_class"),
+        name_of("item_subclass"),
+        name_of("quality"),
+        item_data.get("level") or item_data.get("item_level") or 0,
+        item_data.get("icon_path") or "",
+    )
+
+
+def read_item_rows(item_ids, items_dir=ITEMS_DIR):
+    for item_id in item_ids:
+        try:
+            with open(os.path.join(items_dir, f"{item_id}.json"), "r") as f:
+                yield catalog_row(item_id, jsonBackend.load(f))
+        except Exception as e:
+            print(f"Error reading item {item_id}: {e}")
+
+
+def update_catalog(item_ids, path=CATALOG_FILE, items_dir=ITEMS_DIR):
+    """Add or refresh the given items in the catalog from their files in items_dir."""
+    conn = sqlite3.connect(path)
+    try:
+        init_catalog(conn)
+        conn.executemany("INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?);", read_item_rows(item_ids, items_dir))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def build_catalog(path=CATALOG_FILE, items_dir=ITEMS_DIR):
+    """
+    Compile every item file in items_dir into a fresh catalog at path.
+    Returns the number of items written.
+    """
+    item_ids = sorted(
+        int(name[:-len(".json")]) for name in os.listdir(items_dir)
+        if name.endswith(".json") and name[:-len(".json")].isdigit()
+    )
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    update_catalog(item_ids, tmp_path, items_dir)
+    os.replace(tmp_path, path)
+    return len(item_ids)
+
+
+def load_catalog(path=CATALOG_FILE):
+    """
+    Load the whole catalog into memory.
+    Returns a dict mapping item_id to its data, shaped like the item API response so it can stand
+    in for a data/items file, or an empty dict if there is no catalog yet.
+    """
+    if not os.path.exists(path):
+        return {}
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute("SELECT item_id, name, item_class, item_subclass, quality, level, icon_path FROM items;").fetchall()
+    except sqlite3.Error as e:
+        print(f"Error loading item catalog: {e}")
+        return {}
+    finally:
+        conn.close()
+    return {
+        item_id: {
+            "name": name,
+            "item_class": {"name": item_class},
+            "item_subclass": {"name": item_subclass},
+            "quality": {"name": quality},
+            "level": level,
+            "icon_path": icon_path,
+        }
+        for item_id, name, item_class, item_subclass, quality, level, icon_path in rows
+    }
+
+
+def main():
+    count = build_catalog()
+    print(f"Compiled {count} items into {CATALOG_FILE}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,9 @@
 import os
 import json
 import asyncio
-import aiohttp
-from collections import deque
-# Configuration constants
-REQUESTS_PER_SECOND = 90
-DELAY = 1.0 / REQUESTS_PER_SECOND  # Dynamic delay between requests
+from blizzardClient import create_session, fetch_json, get_oauth_token
 
-class RateLimiter:
-    def __init__(self, rate):
-        self.rate = rate
-        self.timestamps = deque()
-        self.lock = asyncio.Lock()
-
-    async def acquire(self):
-        async with self.lock:
-            now = asyncio.get_event_loop().time()
-            while self.timestamps and now - self.timestamps[0] > 1:
-                self.timestamps.popleft()
-            if len(self.timestamps) >= self.rate:
-                sleep_time = 1 - (now - self.timestamps[0])
-                await asyncio.sleep(sleep_time)
-            self.timestamps.append(asyncio.get_event_loop().time())
-rate_limiter = RateLimiter(REQUESTS_PER_SECOND)
 # API Endpoints and Parameters
-OAUTH_TOKEN_URL = "https://eu.battle.net/oauth/token"
 # For items, we use the US domain and static namespace
 ITEM_API_URL_TEMPLATE = "https://us.api.blizzard.com/data/wow/item/{item_id}?namespace=static-eu"
 
@@ -33,37 +12,18 @@ ENCOUNTERED_ITEMS_FILE = "data/encountered_items.json"
 ITEMS_SAVE_DIR = "data/items"
 MEDIA_SAVE_DIR = "data/media"
 
-async def get_oauth_token(session, client_id, client_secret):
-    """
-    Request an OAuth token using Blizzard client credentials.
-    """
-    data = {"grant_type": "client_credentials"}
-    async with session.post(OAUTH_TOKEN_URL, data=data, auth=aiohttp.BasicAuth(client_id, client_secret)) as resp:
-        resp.raise_for_status()
-        token_data = await resp.json()
-        token = token_data.get("access_token")
-        if not token:
-            raise Exception("Could not retrieve access token.")
-        return token
-
 async def fetch_item_data(session, item_id, headers):
     """
     Fetch the item data for a given item ID.
     """
-    await rate_limiter.acquire()
     url = ITEM_API_URL_TEMPLATE.format(item_id=item_id)
-    async with session.get(url, headers=headers) as resp:
-        resp.raise_for_status()
-        return await resp.json()
+    return await fetch_json(session, url, headers)
 
 async def fetch_media_data(session, media_url, headers):
     """
     Fetch the media data from the provided media URL.
     """
-    await rate_limiter.acquire()
-    async with session.get(media_url, headers=headers) as resp:
-        resp.raise_for_status()
-        return await resp.json()
+    return await fetch_json(session, media_url, headers)
 
 def save_json(data, filename):
     """
@@ -123,7 +83,7 @@ async def main():
         print("No encountered items to process.")
         return
 
-    async with aiohttp.ClientSession() as session:
+    async with create_session() as session:
         # Get OAuth token and prepare headers
         token = await get_oauth_token(session, client_id, client_secret)
         headers = {"Authorization": f"Bearer {token}"}
@@ -141,5 +101,8 @@ async def main():
             if isinstance(result, Exception):
                 print(f"Error processing item {encountered_items[idx]}: {result}")
 
+    # data/itemCatalog.db is not written here; CI rebuilds it whenever the committed data/items change.
+    print("Run python itemCatalog.py to compile the rewritten items into the local item catalog.")
+
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,76 @@
+import os
+import json
+
+# JSON decoder used for reading: "msgspec", "orjson" or "json", or "auto" for the fastest one installed.
+JSON_BACKEND = os.environ.get("JSON_BACKEND", "auto")
+
+msgspec = None
+orjson = None
+if JSON_BACKEND in ("auto", "msgspec"):
+    try:
+        import msgspec
+    except ImportError:
+        pass
+if JSON_BACKEND in ("auto", "orjson") and msgspec is None:
+    try:
+        import orjson
+    except ImportError:
+        pass
+
+if msgspec is not None:
+    BACKEND = "msgspec"
+    DecodeError = (msgspec.DecodeError, ValueError)
+    loads = msgspec.json.decode
+
+    class AuctionItem(msgspec.Struct):
+        id: int | None = None
+        bonus_lists: list[int] = []
+
+    class Auction(msgspec.Struct):
+        """The fields of an auction the sniper reads; everything else is skipped while decoding."""
+        id: int | None = None
+        item: AuctionItem = msgspec.field(default_factory=AuctionItem)
+        buyout: int = 0
+        quantity: int = 1
+        time_left: str = ""
+
+    _auction_decoder = msgspec.json.Decoder(Auction)
+
+    def decode_auction_row(text):
+        auction = _auction_decoder.decode(text)
+        item = auction.item
+        return auction.id, item.id, auction.buyout, auction.quantity, auction.time_left, item.bonus_lists
+elif orjson is not None:
+    BACKEND = "orjson"
+    DecodeError = (orjson.JSONDecodeError, ValueError)
+    loads = orjson.loads
+
+    def decode_auction_row(text):
+        return auction_row(orjson.loads(text))
+else:
+    BACKEND = "json"
+    DecodeError = ValueError
+    loads = json.loads
+
+    def decode_auction_row(text):
+        return auction_row(json.loads(text))
+
+
+def auction_row(auction):
+    """
+    Reduce a decoded auction dict to (auction_id, item_id, buyout, quantity, time_left, bonus_lists).
+    """
+    item = auction.get("item", {})
+    return (
+        auction.get("id"),
+        item.get("id"),
+        auction.get("buyout", 0),
+        auction.get("quantity", 1),
+        auction.get("time_left", ""),
+        item.get("bonus_lists", []),
+    )
+
+
+def load(f):
+    """Decode a JSON file object opened in text or binary mode."""
+    return loads(f.read())
@@ -0,0 +1,86 @@
+import numpy as np
+
+
+def build_eligibility_arrays(eligibility):
+    """
+    Turn the compiled eligibility (item_id -> (min_buyout, threshold_ratio) or None) into sorted arrays:
+    (item_ids, eligible, min_buyouts, ratios).
+    """
+    item_ids = np.fromiter(eligibility.keys(), dtype=np.int64, count=len(eligibility))
+    order = np.argsort(item_ids)
+    rules = list(eligibility.values())
+    eligible = np.fromiter((r is not None for r in rules), dtype=bool, count=len(rules))
+    min_buyouts = np.fromiter((r[0] if r else 0 for r in rules), dtype=np.float64, count=len(rules))
+    ratios = np.fromiter((r[1] if r else 0 for r in rules), dtype=np.float64, count=len(rules))
+    return item_ids[order], eligible[order], min_buyouts[order], ratios[order]
+
+
+def lookup(sorted_keys, keys):
+    """Positions of keys in sorted_keys and whether they were found."""
+    if len(sorted_keys) == 0:
+        return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool)
+    positions = np.searchsorted(sorted_keys, keys)
+    positions = np.minimum(positions, len(sorted_keys) - 1)
+    return positions, sorted_keys[positions] == keys
+
+
+def select_qualifying(records, averages, eligibility, special_items, get_bonus_key):
+    """
+    Evaluate the snipe thresholds of sniper.cross_reference_item for all records at once.
+    records are sniper auction records, averages the baselines keyed by (item_id, bonus_key),
+    eligibility the compiled per-item rules and special_items the auction_id -> threshold overrides.
+    Returns (qualifying, fallback): indices of the qualifying records ordered by realm, item,
+    buyout and position, and indices of records whose item is not in eligibility, which have to
+    be checked against the presets one by one.
+    """
+    count = len(records)
+    realms = {}
+    bonus_codes = {}
+    realm_column = np.empty(count, dtype=np.int64)
+    item_column = np.empty(count, dtype=np.int64)
+    buyout_column = np.empty(count, dtype=np.float64)
+    auction_column = np.empty(count, dtype=np.int64)
+    bonus_column = np.empty(count, dtype=np.int64)
+    for i, (realm, auction_id, item_id, buyout, _, _, bonus_lists, _) in enumerate(records):
+        realm_column[i] = realms.setdefault(realm, len(realms))
+        item_column[i] = item_id
+        buyout_column[i] = buyout
+        auction_column[i] = auction_id
+        bonus_column[i] = bonus_codes.setdefault(get_bonus_key(bonus_lists), len(bonus_codes))
+
+    # Items: eligible ones get their thresholds, unknown ones go the slow way.
+    elig_ids, elig_flags, elig_min_buyouts, elig_ratios = build_eligibility_arrays(eligibility)
+    positions, known = lookup(elig_ids, item_column)
+    fallback = np.flatnonzero(~known)
+    eligible = known & elig_flags[positions]
+    min_buyouts = elig_min_buyouts[positions]
+    ratios = elig_ratios[positions]
+
+    # Baselines, joined by variant (item_id, bonus code).
+    stride = max(len(bonus_codes), 1)
+    variant_keys = item_column * stride + bonus_column
+    baseline_entries = [
+        (item_id * stride + bonus_codes[bonus_key], avg)
+        for (item_id, bonus_key), avg in averages.items()
+        if bonus_key in bonus_codes and avg
+    ]
+    baseline_keys = np.fromiter((key for key, _ in baseline_entries), dtype=np.int64, count=len(baseline_entries))
+    baseline_values = np.fromiter((avg for _, avg in baseline_entries), dtype=np.float64, count=len(baseline_entries))
+    order = np.argsort(baseline_keys)
+    baseline_keys, baseline_values = baseline_keys[order], baseline_values[order]
+    positions, has_baseline = lookup(baseline_keys, variant_keys)
+    avg = np.where(has_baseline, baseline_values[positions] if len(baseline_values) else 0.0, 0.0)
+
+    # Per-auction overrides from specialItems.json.
+    special_entries = sorted((int(auction_id), threshold) for auction_id, threshold in special_items.items() if str(auction_id).isdigit())
+    special_ids = np.array([auction_id for auction_id, _ in special_entries], dtype=np.int64)
+    special_thresholds = np.array([threshold for _, threshold in special_entries], dtype=np.float64)
+    positions, is_special = lookup(special_ids, auction_column)
+    special_hit = is_special & (buyout_column < (special_thresholds[positions] if len(special_thresholds) else 0.0))
+
+    qualifies = eligible & has_baseline & (
+        special_hit | ((buyout_column < ratios * avg) & (buyout_column >= min_buyouts))
+    )
+    indices = np.flatnonzero(qualifies)
+    order = np.lexsort((indices, buyout_column[indices], item_column[indices], realm_column[indices]))
+    return indices[order].tolist(), fallback.tolist()
@@ -2,38 +2,13 @@ import os
 import re
 import json
 import asyncio
-import aiohttp
-from glob import glob
-from collections import deque
-import random
-
-class RateLimiter:
-    def __init__(self, rate):
-        self.rate = rate
-        self.timestamps = deque()
-        self.lock = asyncio.Lock()
-
-    async def acquire(self):
-        async with self.lock:
-            now = asyncio.get_event_loop().time()
-            while self.timestamps and now - self.timestamps[0] > 1:
-                self.timestamps.popleft()
-            if len(self.timestamps) >= self.rate:
-                sleep_time = 1 - (now - self.timestamps[0])
-                await asyncio.sleep(sleep_time)
-            self.timestamps.append(asyncio.get_event_loop().time())
-
-# --- Configuration Constants ---
-REQUESTS_PER_SECOND = 90
-DELAY = 1.0 / REQUESTS_PER_SECOND  # Delay based on rate limit
-MAX_RETRIES = 5
-
-# Create a global instance of RateLimiter:
-rate_limiter = RateLimiter(REQUESTS_PER_SECOND)
+from auctionSnapshot import iter_auction_rows, list_auction_files
+from blizzardClient import API_BASE_URL, create_session, fetch_json, get_oauth_token
+from itemCatalog import CATALOG_FILE, build_catalog, update_catalog
+from runReport import report
 
 # Endpoints and namespaces for item requests
-OAUTH_TOKEN_URL = "https://eu.battle.net/oauth/token"
-ITEM_API_URL_TEMPLATE = "https://eu.api.blizzard.com/data/wow/item/{item_id}?namespace=static-eu"
+ITEM_API_URL_TEMPLATE = API_BASE_URL + "/data/wow/item/{item_id}?namespace=static-eu"
 
 # File paths
 AUCTIONS_DIR = os.path.join("data", "auctions") # Auctions files named like data/realm_{realm_id}.json
@@ -64,78 +39,21 @@ def load_auctions_item_ids():
     extracts the set of item IDs.
     """
     item_ids = set()
-    # Assume auctions files match the pattern "realm_*.json"
-    for filepath in glob(os.path.join(AUCTIONS_DIR, "*.json")):
+    # Auction files are JSON or columnar snapshots named like "{realm_id}.json" / "{realm_id}.snap"
+    for filepath in list_auction_files(AUCTIONS_DIR):
         try:
-            with open(filepath, "r") as f:
-                data = json.load(f)
-                auctions = data.get("auctions", [])
-                for auction in auctions:
-                    item = auction.get("item", {})
-                    item_id = item.get("id")
-                    if item_id:
-                        item_ids.add(str(item_id))
+            # Decode one auction at a time instead of loading the whole file.
+            for _, item_id, *_ in iter_auction_rows(filepath):
+                if item_id:
+                    item_ids.add(str(item_id))
         except Exception as e:
             print(f"Error reading {filepath}: {e}")
     return item_ids
 
 
-async def get_oauth_token(session, client_id, client_secret):
-    data = {"grant_type": "client_credentials"}
-    async with session.post(OAUTH_TOKEN_URL, data=data, auth=aiohttp.BasicAuth(client_id, client_secret)) as resp:
-        resp.raise_for_status()
-        token_data = await resp.json()
-        token = token_data.get("access_token")
-        if not token:
-            raise Exception("Could not retrieve access token.")
-        return token
-
-
-async def fetch_data(session, url, headers, retries=MAX_RETRIES, delay=DELAY):
-    """
-    Fetch JSON data from the URL with retry logic.
-    
-    Blizzard's throttling guidelines state:
-      - Up to 100 requests per second are allowed.
-      - Exceeding the per-second limit results in a 429 error for the remainder of the second.
-    
-    If we get a 429, wait 1 second (to allow the quota to refresh) before retrying.
-    """
-    for attempt in range(1, retries + 1):
-        try:
-            # Rate limit requests
-            await rate_limiter.acquire()
-            async with session.get(url, headers=headers) as resp:
-                if resp.status == 429:
-                    # 429: Too many requests for this second
-                    if attempt < retries:
-                        await asyncio.sleep(random.uniform(1, 10))
-                        continue
-                    else:
-                        raise aiohttp.ClientResponseError(
-                            status=resp.status,
-                            request_info=resp.request_info,
-                            history=resp.history,
-                            message=f"Rate limit exceeded on final attempt for {url}"
-                        )
-                resp.raise_for_status()
-                return await resp.json()
-        except aiohttp.ClientResponseError as e:
-            if e.status == 429:
-                if attempt < retries:
-                    await asyncio.sleep(1)
-                    continue
-                else:
-                    print(f"Final attempt reached for {url}. Giving up due to rate limit.")
-                    raise
-            else:
-                raise
-    raise Exception("Failed to fetch data after maximum retries")
-
-
 async def fetch_item_data(session, item_id, headers):
     url = ITEM_API_URL_TEMPLATE.format(item_id=item_id)
-    return await fetch_data(session, url, headers)
+    return await fetch_json(session, url, headers)
 
 async def fetch_and_save_icon(session, icon_url):
     """
@@ -161,7 +79,7 @@ async def fetch_and_save_icon(session, icon_url):
 
 
 async def fetch_media_data(session, media_url, headers):
-    return await fetch_data(session, media_url, headers)
+    return await fetch_json(session, media_url, headers)
 
 
 async def process_new_item(session, item_id, headers):
@@ -212,7 +130,7 @@ async def process_new_item(session, item_id, headers):
         return False
 
 async def process_new_items(new_item_ids, headers, client_id, client_secret):
-    async with aiohttp.ClientSession() as session:
+    async with create_session() as session:
         token = await get_oauth_token(session, client_id, client_secret)
         headers["Authorization"] = f"Bearer {token}"
 
@@ -233,7 +151,8 @@ async def main():
         raise Exception("Missing BLIZZARD_CLIENT_ID or BLIZZARD_CLIENT_SECRET.")
 
     # Load item IDs from committed auctions data
-    current_item_ids = load_auctions_item_ids()
+    with report.stage("scan_auctions"):
+        current_item_ids = load_auctions_item_ids()
     print(f"Found {len(current_item_ids)} unique item IDs in auctions data.")
 
     # Load previously encountered items
@@ -247,8 +166,19 @@ async def main():
     headers = {}
     processed_new_items = set()
     if new_items:
-        processed_new_items = await process_new_items(list(new_items), headers, client_id, client_secret)
+        with report.stage("fetch_items"):
+            processed_new_items = await process_new_items(list(new_items), headers, client_id, client_secret)
         print(f"Successfully processed {len(processed_new_items)} new items.")
+        report.count("items_fetched", len(processed_new_items))
+        report.count("items_failed", len(new_items) - len(processed_new_items))
+
+    # Keep the sniper's item catalog in step with ITEMS_SAVE_DIR.
+    with report.stage("update_catalog"):
+        if not os.path.exists(CATALOG_FILE):
+            print(f"Compiled {build_catalog(CATALOG_FILE, ITEMS_SAVE_DIR)} items into {CATALOG_FILE}.")
+        elif processed_new_items:
+            update_catalog(sorted(processed_new_items), CATALOG_FILE, ITEMS_SAVE_DIR)
+            print(f"Added {len(processed_new_items)} items to {CATALOG_FILE}.")
 
     # Update encountered items file (only add items that were successfully processed)
     final_encountered = list(old_items.union(processed_new_items))
@@ -258,4 +188,7 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    finally:
+        report.write("processAuctionsRequest")
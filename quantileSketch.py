@@ -0,0 +1,147 @@
+import sys
+import zlib
+import math
+import struct
+from array import array
+
+# Accuracy parameter: rank error is roughly 1.7 / SKETCH_K with high probability.
+SKETCH_K = 128
+# Smallest compactor size at the bottom levels.
+MIN_LEVEL_CAPACITY = 8
+LEVEL_CAPACITY_DECAY = 2 / 3
+
+# Serialized layout: version, k, level count, compaction parity bits, total weight, level sizes,
+# then every level's values sorted and delta encoded as little-endian int64, all zlib compressed.
+_VERSION = 1
+_HEADER = struct.Struct("<BHBIQ")
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch over integer prices.
+    Keeps O(k log n) values regardless of how many were added, answers any quantile with
+    bounded rank error, and two sketches merge into one describing the union of their inputs,
+    so per-realm or per-shard sketches can be combined.
+    Compaction alternates between keeping odd and even ranked values per level instead of
+    flipping a coin, which keeps results reproducible.
+    """
+    def __init__(self, k=SKETCH_K):
+        self.k = k
+        self.levels = [[]]
+        self.parity = 0  # Bit h: which half level h keeps on its next compaction.
+        self.n = 0
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(MIN_LEVEL_CAPACITY, int(math.ceil(self.k * LEVEL_CAPACITY_DECAY ** depth)))
+
+    def _size(self):
+        return sum(len(level) for level in self.levels)
+
+    def _max_size(self):
+        return sum(self._capacity(level) for level in range(len(self.levels)))
+
+    def _compress(self):
+        while self._size() > self._max_size():
+            for level, values in enumerate(self.levels):
+                if len(values) >= self._capacity(level):
+                    break
+            if level + 1 == len(self.levels):
+                self.levels.append([])
+            values.sort()
+            # An odd value out stays behind so no weight is lost.
+            keep = [values.pop()] if len(values) % 2 else []
+            offset = (self.parity >> level) & 1
+            self.parity ^= 1 << level
+            self.levels[level + 1].extend(values[offset::2])
+            self.levels[level] = keep
+
+    def update(self, value, weight=1):
+        """Add value, weight times (weights > 1 are used when folding in pre-aggregated history)."""
+        for _ in range(weight):
+            self.levels[0].append(value)
+            self.n += 1
+            if len(self.levels[0]) >= self._capacity(0):
+                self._compress()
+
+    def merge(self, other):
+        """Fold another sketch into this one."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, values in enumerate(other.levels):
+            self.levels[level].extend(values)
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        """Return the value at quantile q (0 <= q <= 1), or None for an empty sketch."""
+        weighted = sorted(
+            (value, 1 << level)
+            for level, values in enumerate(self.levels)
+            for value in values
+        )
+        if not weighted:
+            return None
+        total = sum(weight for _, weight in weighted)
+        target = q * total
+        cumulative = 0
+        for value, weight in weighted:
+            cumulative += weight
+            if cumulative >= target:
+                return value
+        return weighted[-1][0]
+
+    def to_bytes(self):
+        sizes = array("I", (len(values) for values in self.levels))
+        deltas = array("q")
+        for values in self.levels:
+            previous = 0
+            for value in sorted(values):
+                deltas.append(value - previous)
+                previous = value
+        if sys.byteorder == "big":
+            sizes.byteswap()
+            deltas.byteswap()
+        header = _HEADER.pack(_VERSION, self.k, len(self.levels), self.parity, self.n)
+        return zlib.compress(header + sizes.tobytes() + deltas.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = zlib.decompress(data)
+        version, k, level_count, parity, n = _HEADER.unpack_from(data, 0)
+        if version != _VERSION:
+            raise ValueError(f"Unsupported sketch version {version}")
+        sketch = cls(k)
+        sketch.parity = parity
+        sketch.n = n
+        offset = _HEADER.size
+        sizes = array("I")
+        sizes.frombytes(data[offset:offset + 4 * level_count])
+        offset += 4 * level_count
+        deltas = array("q")
+        deltas.frombytes(data[offset:])
+        if sys.byteorder == "big":
+            sizes.byteswap()
+            deltas.byteswap()
+        sketch.levels = []
+        position = 0
+        for size in sizes:
+            values = []
+            previous = 0
+            for delta in deltas[position:position + size]:
+                previous += delta
+                values.append(previous)
+            sketch.levels.append(values)
+            position += size
+        return sketch
+
+
+def merge_sketches(sketches):
+    """Merge an iterable of sketches (e.g. from several realms or sharded runs) into a new one."""
+    merged = None
+    for sketch in sketches:
+        if merged is None:
+            merged = KLLSketch(sketch.k)
+        merged.merge(sketch)
+    return merged
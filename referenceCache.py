@@ -0,0 +1,97 @@
+import os
+import pickle
+import hashlib
+import threading
+
+# Preprocessed reference data, one pickle per source file.
+REFERENCE_CACHE_DIR = os.path.join(".cache", "reference")
+# Bump when what is cached for a source changes, so old caches are rebuilt.
+REFERENCE_CACHE_VERSION = 1
+
+_loaded = {}  # name -> (stat key, value)
+_lock = threading.Lock()
+
+
+def stat_key(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_reference(path, build, name=None):
+    """
+    Return build(f) for the source file path opened in binary mode, preprocessed once and then
+    served from memory and from a pickle in REFERENCE_CACHE_DIR.
+    The cache is keyed by the file's modification time and size; when those changed (e.g. after
+    a fresh checkout) the file's sha256 decides whether it has to be rebuilt.
+    Every call checks the file's modification time, so changes are picked up by running processes.
+    Errors reading or building the source are raised to the caller.
+    """
+    name = name or os.path.basename(path)
+    key = stat_key(path)
+    loaded = _loaded.get(name)
+    if loaded and loaded[0] == key:
+        return loaded[1]
+
+    with _lock:
+        cache_path = os.path.join(REFERENCE_CACHE_DIR, f"{name}.pickle")
+        cached = None
+        try:
+            with open(cache_path, "rb") as f:
+                cached = pickle.load(f)
+            if cached.get("version") != REFERENCE_CACHE_VERSION:
+                cached = None
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Ignoring unreadable reference cache {cache_path}: {e}")
+
+        digest = None
+        if cached and cached["stat"] != key:
+            digest = file_digest(path)
+            if cached["sha256"] != digest:
+                cached = None
+            else:
+                # Same content, only the modification time changed: refresh the key.
+                cached["stat"] = key
+                save_reference_cache(cache_path, cached)
+        if cached is None:
+            with open(path, "rb") as f:
+                value = build(f)
+            cached = {
+                "version": REFERENCE_CACHE_VERSION,
+                "stat": key,
+                "sha256": digest or file_digest(path),
+                "value": value,
+            }
+            save_reference_cache(cache_path, cached)
+
+        _loaded[name] = (key, cached["value"])
+        return cached["value"]
+
+
+def preload_reference(path, value, name=None):
+    """
+    Serve value as the loaded reference data of path, e.g. in a worker process given the data
+    its parent already loaded, so load_reference neither reads the cache nor rebuilds it.
+    """
+    _loaded[name or os.path.basename(path)] = (stat_key(path), value)
+
+
+def save_reference_cache(cache_path, cached):
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # Parse workers may write the same cache at the same time.
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Could not cache reference data in {cache_path}: {e}")
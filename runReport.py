@@ -0,0 +1,149 @@
+import os
+import re
+import json
+import time
+import threading
+import contextlib
+import datetime
+
+# Where every script writes its JSON run report ({script}.json).
+RUN_REPORT_DIR = os.environ.get("RUN_REPORT_DIR", "reports")
+# If set, a Prometheus textfile ({script}.prom) is written there too, e.g. for node_exporter's textfile collector.
+PROMETHEUS_TEXTFILE_DIR = os.environ.get("PROMETHEUS_TEXTFILE_DIR")
+# Upper bounds of the HTTP latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class RunReport:
+    """
+    Collects per-stage timings, counters, cache statistics and HTTP latencies of one run.
+    Stage CPU time is that of the whole process, so it includes worker threads.
+    Everything may be updated from worker threads.
+    """
+    def __init__(self):
+        self.started_at = datetime.datetime.now(datetime.timezone.utc)
+        self.stages = {}    # name -> {"calls", "wall_s", "cpu_s"}
+        self.counters = {}  # name -> value
+        self.caches = {}    # name -> {"hits", "misses"}
+        self.http = {}      # endpoint -> {"count", "sum_s", "buckets" (cumulative, like Prometheus), "status"}
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time the enclosed block as stage name; repeated stages add up."""
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - start_wall, time.process_time() - start_cpu
+            with self.lock:
+                entry = self.stages.setdefault(name, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0})
+                entry["calls"] += 1
+                entry["wall_s"] += wall
+                entry["cpu_s"] += cpu
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def cache(self, name, hits, misses):
+        """Add cache hits and misses, e.g. from a functools.lru_cache's cache_info()."""
+        with self.lock:
+            entry = self.caches.setdefault(name, {"hits": 0, "misses": 0})
+            entry["hits"] += hits
+            entry["misses"] += misses
+
+    def observe_http(self, endpoint, seconds, status):
+        """Record the latency and status of one HTTP request to endpoint."""
+        with self.lock:
+            entry = self.http.setdefault(endpoint, {
+                "count": 0, "sum_s": 0.0, "buckets": [0] * len(LATENCY_BUCKETS), "status": {},
+            })
+            entry["count"] += 1
+            entry["sum_s"] += seconds
+            for n, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    entry["buckets"][n] += 1
+            entry["status"][str(status)] = entry["status"].get(str(status), 0) + 1
+
+    def to_dict(self, script):
+        finished_at = datetime.datetime.now(datetime.timezone.utc)
+        with self.lock:
+            return {
+                "script": script,
+                "started_at": self.started_at.isoformat(),
+                "finished_at": finished_at.isoformat(),
+                "duration_s": (finished_at - self.started_at).total_seconds(),
+                "stages": self.stages,
+                "counters": self.counters,
+                "caches": {
+                    name: dict(entry, hit_rate=entry["hits"] / max(entry["hits"] + entry["misses"], 1))
+                    for name, entry in self.caches.items()
+                },
+                "http": {
+                    endpoint: dict(entry, bucket_bounds_s=list(LATENCY_BUCKETS))
+                    for endpoint, entry in self.http.items()
+                },
+            }
+
+    def to_prometheus(self, script):
+        """Render the report in the Prometheus text exposition format."""
+        data = self.to_dict(script)
+        job = f'script="{script}"'
+        lines = [
+            "# TYPE auction_sniper_run_duration_seconds gauge",
+            f"auction_sniper_run_duration_seconds{{{job}}} {data['duration_s']}",
+            "# TYPE auction_sniper_run_finished_timestamp_seconds gauge",
+            f"auction_sniper_run_finished_timestamp_seconds{{{job}}} {time.time()}",
+            "# TYPE auction_sniper_stage_seconds gauge",
+        ]
+        for name, entry in data["stages"].items():
+            lines.append(f'auction_sniper_stage_seconds{{{job},stage="{name}",clock="wall"}} {entry["wall_s"]}')
+            lines.append(f'auction_sniper_stage_seconds{{{job},stage="{name}",clock="cpu"}} {entry["cpu_s"]}')
+        lines.append("# TYPE auction_sniper_count gauge")
+        for name, value in data["counters"].items():
+            lines.append(f'auction_sniper_count{{{job},name="{name}"}} {value}')
+        lines.append("# TYPE auction_sniper_cache_requests gauge")
+        for name, entry in data["caches"].items():
+            lines.append(f'auction_sniper_cache_requests{{{job},cache="{name}",result="hit"}} {entry["hits"]}')
+            lines.append(f'auction_sniper_cache_requests{{{job},cache="{name}",result="miss"}} {entry["misses"]}')
+        lines.append("# TYPE auction_sniper_http_request_duration_seconds histogram")
+        for endpoint, entry in data["http"].items():
+            labels = f'{job},endpoint="{endpoint}"'
+            for bound, value in zip(LATENCY_BUCKETS, entry["buckets"]):
+                lines.append(f'auction_sniper_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {value}')
+            lines.append(f'auction_sniper_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {entry["count"]}')
+            lines.append(f"auction_sniper_http_request_duration_seconds_sum{{{labels}}} {entry['sum_s']}")
+            lines.append(f"auction_sniper_http_request_duration_seconds_count{{{labels}}} {entry['count']}")
+        lines.append("# TYPE auction_sniper_http_responses gauge")
+        for endpoint, entry in data["http"].items():
+            for status, value in entry["status"].items():
+                lines.append(f'auction_sniper_http_responses{{{job},endpoint="{endpoint}",status="{status}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, script):
+        """Write the JSON report to RUN_REPORT_DIR and, if configured, the Prometheus textfile."""
+        try:
+            write_atomic(os.path.join(RUN_REPORT_DIR, f"{script}.json"), json.dumps(self.to_dict(script), indent=2))
+            if PROMETHEUS_TEXTFILE_DIR:
+                write_atomic(os.path.join(PROMETHEUS_TEXTFILE_DIR, f"{script}.prom"), self.to_prometheus(script))
+        except OSError as e:
+            print(f"Could not write run report: {e}")
+
+
+def write_atomic(path, text):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def endpoint_name(url):
+    """Group request URLs by endpoint: the path with numeric ids replaced and the query dropped."""
+    path = url.split("://", 1)[-1].split("?", 1)[0]
+    path = path.split("/", 1)[1] if "/" in path else ""
+    return "/" + re.sub(r"/\d+(?=/|$)", "/{id}", path)
+
+
+report = RunReport()
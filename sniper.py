@@ -1,19 +1,35 @@
 import os
 import json
-import glob
 import sqlite3
+import hashlib
+import jsonBackend
 import datetime
-import requests
 import concurrent.futures
-from functools import lru_cache
+from functools import lru_cache, partial
+from itertools import repeat
+from auctionSnapshot import iter_auction_rows, list_auction_files, read_auction_header
+from quantileSketch import KLLSketch, merge_sketches
+from itemCatalog import CATALOG_FILE, load_catalog
+from runReport import report
+from referenceCache import load_reference, preload_reference
 # Directories and files
 AUCTIONS_DIR = "data/auctions"
 ITEMS_DIR = "data/items"
 RELEVANT_REALMS_FILE = "config/relevantRealms.json"
+REALM_MAP_FILE = "data/realm-map.json"
 SPECIAL_ITEMS_FILE = "config/specialItems.json"
 ITEM_CLASSES_FILE = "config/itemClasses.json"
 RAIDERIO_BONUS_FILE = "data/BonusIds.json"
 EXPANSION_FILE = "data/ExpansionDisplayInfo.json"
+COMMODITIES_FILE = "data/commodities.json"
+# Local caches of derived data, safe to delete.
+CACHE_DIR = ".cache"
+ELIGIBILITY_CACHE_FILE = os.path.join(CACHE_DIR, "eligibility.json")
+# Pseudo-realm under which region-wide commodity prices are stored in item_prices.
+COMMODITIES_REALM = "commodities"
+# Bonus table used while RAIDERIO_BONUS_FILE cannot be loaded.
+EMPTY_BONUS_TABLE = ({}, {})
+_bonus_table = None  # The table resolve_bonus_key and resolve_bonus_level are memoised with.
 
 # SQLite database file to store historical auction data.
 DB_FILE = "auctions.db"
@@ -24,7 +40,43 @@ DISCORD_WEBHOOK_URL = os.environ.get("DISCORD_WEBHOOK_URL")
 # Threshold constants
 MIN_BUYOUT = 100000000       # Only consider auctions with buyout at least 10k (4 extra zeroes to convert from gold to copper)
 THRESHOLD_RATIO = 0.20   # Auction is a "snipe" if buyout is less than 20% of historical average
+ANNOUNCE_LIMIT = 5       # Cheapest qualifying auctions announced per run
 
+# Engine used to evaluate auctions: "numpy" (numpyEngine.py, needs NumPy), "python", or "auto" for numpy when installed.
+SNIPER_ENGINE = os.environ.get("SNIPER_ENGINE", "auto")
+
+# Processes parsing auction files in parallel; 1 parses them in this process.
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", os.cpu_count() or 1))
+
+# Price aggregates kept in item_price_stats, per realm and across all realms (ALL_REALMS).
+ALL_REALMS = "*"
+EWMA_ALPHA = 0.1         # Weight of a new observation in the exponentially decayed mean
+# Historical baseline the threshold ratio applies to: the mean by default, or this quantile of the
+# variant's price sketch in item_price_sketches (e.g. 0.5 for the median, 0.25 for p25).
+# The sketches are only updated while it is set.
+BASELINE_QUANTILE = float(os.environ["BASELINE_QUANTILE"]) if os.environ.get("BASELINE_QUANTILE") else None
+
+# Auctions last at most 48 hours, so announcements older than that can be forgotten.
+ANNOUNCED_TTL_HOURS = int(os.environ.get("ANNOUNCED_TTL_HOURS", 48))
+
+# Retention of the item_prices history. Raw rows older than RAW_RETENTION_DAYS are rolled into
+# hourly buckets, hourly buckets older than HOURLY_RETENTION_DAYS into daily buckets.
+RAW_RETENTION_DAYS = int(os.environ.get("RAW_RETENTION_DAYS", 7))
+HOURLY_RETENTION_DAYS = int(os.environ.get("HOURLY_RETENTION_DAYS", 60))
+VACUUM_INTERVAL_DAYS = int(os.environ.get("VACUUM_INTERVAL_DAYS", 7))
+
+
+def connect_db(path=None, **kwargs):
+    """
+    Open the price database (DB_FILE by default) in WAL mode with relaxed syncing: a crash can lose
+    the last transaction but never corrupts the file, and the database is restored from cache anyway.
+    kwargs are passed on to sqlite3.connect.
+    """
+    conn = sqlite3.connect(path or DB_FILE, **kwargs)
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute("PRAGMA synchronous = NORMAL;")
+    conn.execute("PRAGMA temp_store = MEMORY;")
+    return conn
 
 def init_db(conn):
     """Create a table for aggregated item prices if it doesn't exist."""
@@ -38,115 +90,547 @@ def init_db(conn):
             PRIMARY KEY (realm, item_id, bonus_key, timestamp)
         );
     """)
+    # Retention selects and deletes rows by age.
+    conn.execute("CREATE INDEX IF NOT EXISTS item_prices_timestamp ON item_prices (timestamp);")
+    init_stats_db(conn)
+    init_rollup_db(conn)
+    # The table is kept without BASELINE_QUANTILE, it may hold sketches merged from sharded runs.
+    init_sketch_db(conn, backfill=BASELINE_QUANTILE is not None)
     conn.commit()
 
+def init_stats_db(conn):
+    """
+    Create the materialised price aggregates, maintained alongside every insert into item_prices,
+    so baselines never need a scan over the whole history.
+    An existing history is folded into it once when the table is first created.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS item_price_stats (
+            item_id INTEGER,
+            bonus_key TEXT,
+            realm TEXT,
+            count INTEGER,
+            total REAL,
+            total_sq REAL,
+            ewma REAL,
+            updated_at TEXT,
+            PRIMARY KEY (item_id, bonus_key, realm)
+        );
+    """)
+    if conn.execute("SELECT 1 FROM item_price_stats LIMIT 1;").fetchone():
+        return
+    for realm_column in ("realm", f"'{ALL_REALMS}'"):
+        conn.execute(f"""
+            INSERT INTO item_price_stats (item_id, bonus_key, realm, count, total, total_sq, ewma, updated_at)
+            SELECT item_id, bonus_key, {realm_column}, COUNT(*), TOTAL(min_buyout),
+                   TOTAL(CAST(min_buyout AS REAL) * min_buyout), AVG(min_buyout), MAX(timestamp)
+            FROM item_prices
+            GROUP BY item_id, bonus_key, {realm_column};
+        """)
+
+def init_sketch_db(conn, backfill=True):
+    """
+    Create the per-variant price sketches (see quantileSketch.py), per realm and for ALL_REALMS.
+    With backfill, an existing history, including rolled up buckets, is folded into an empty
+    table once; the ALL_REALMS sketches are merged from the realm ones.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS item_price_sketches (
+            item_id INTEGER,
+            bonus_key TEXT,
+            realm TEXT,
+            sketch BLOB,
+            PRIMARY KEY (item_id, bonus_key, realm)
+        );
+    """)
+    if not backfill or conn.execute("SELECT 1 FROM item_price_sketches LIMIT 1;").fetchone():
+        return
+    history = "SELECT realm, item_id, bonus_key, min_buyout, 1 FROM item_prices"
+    for table in ("item_prices_hourly", "item_prices_daily"):
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?;", (table,)).fetchone():
+            history += f" UNION ALL SELECT realm, item_id, bonus_key, CAST(avg_buyout AS INTEGER), count FROM {table}"
+    sketches = {}
+    for realm, item_id, bonus_key, price, weight in conn.execute(history + ";"):
+        sketches.setdefault((item_id, bonus_key, realm), KLLSketch()).update(price, weight)
+    by_variant = {}
+    for (item_id, bonus_key, realm), sketch in sketches.items():
+        by_variant.setdefault((item_id, bonus_key), []).append(sketch)
+    for (item_id, bonus_key), realm_sketches in by_variant.items():
+        sketches[(item_id, bonus_key, ALL_REALMS)] = merge_sketches(realm_sketches)
+    save_price_sketches(conn, sketches)
+
+def init_rollup_db(conn):
+    """Create the hourly and daily min/avg/count buckets that old item_prices rows are rolled into."""
+    for table in ("item_prices_hourly", "item_prices_daily"):
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                realm TEXT,
+                item_id INTEGER,
+                bonus_key TEXT,
+                bucket TEXT,
+                min_buyout INTEGER,
+                avg_buyout REAL,
+                count INTEGER,
+                PRIMARY KEY (realm, item_id, bonus_key, bucket)
+            );
+        """)
+    conn.execute("CREATE INDEX IF NOT EXISTS item_prices_hourly_bucket ON item_prices_hourly (bucket);")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS maintenance (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """)
+
+def rollup_prices(conn, source, target, bucket_expr, bucket_column, cutoff):
+    """
+    Merge the rows of source older than cutoff into the buckets of target, then delete them.
+    bucket_expr derives the target bucket from a source row. Does not commit.
+    """
+    if source == "item_prices":
+        columns = "MIN(min_buyout), AVG(min_buyout), COUNT(*)"
+    else:
+        columns = "MIN(min_buyout), TOTAL(avg_buyout * count) / TOTAL(count), SUM(count)"
+    conn.execute(f"""
+        INSERT INTO {target} (realm, item_id, bonus_key, bucket, min_buyout, avg_buyout, count)
+        SELECT realm, item_id, bonus_key, {bucket_expr}, {columns}
+        FROM {source}
+        WHERE {bucket_column} < ?
+        GROUP BY realm, item_id, bonus_key, {bucket_expr}
+        ON CONFLICT (realm, item_id, bonus_key, bucket) DO UPDATE SET
+            min_buyout = MIN(min_buyout, excluded.min_buyout),
+            avg_buyout = (avg_buyout * count + excluded.avg_buyout * excluded.count) / (count + excluded.count),
+            count = count + excluded.count;
+    """, (cutoff,))
+    conn.execute(f"DELETE FROM {source} WHERE {bucket_column} < ?;", (cutoff,))
+
+def apply_retention(conn):
+    """
+    Keep auctions.db bounded: roll raw item_prices rows older than RAW_RETENTION_DAYS into hourly
+    buckets, hourly buckets older than HOURLY_RETENTION_DAYS into daily buckets, and VACUUM the
+    database every VACUUM_INTERVAL_DAYS. Baselines are unaffected since they come from item_price_stats.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    raw_cutoff = (now - datetime.timedelta(days=RAW_RETENTION_DAYS)).isoformat()
+    # Hourly buckets look like "2025-01-31T18"; a full ISO timestamp sorts after its own hour.
+    hourly_cutoff = (now - datetime.timedelta(days=HOURLY_RETENTION_DAYS)).isoformat()[:13]
+    rollup_prices(conn, "item_prices", "item_prices_hourly", "substr(timestamp, 1, 13)", "timestamp", raw_cutoff)
+    rollup_prices(conn, "item_prices_hourly", "item_prices_daily", "substr(bucket, 1, 10)", "bucket", hourly_cutoff)
+    conn.commit()
+
+    row = conn.execute("SELECT value FROM maintenance WHERE key = 'last_vacuum';").fetchone()
+    last_vacuum = datetime.datetime.fromisoformat(row[0]) if row else None
+    if last_vacuum is None or now - last_vacuum >= datetime.timedelta(days=VACUUM_INTERVAL_DAYS):
+        conn.execute("INSERT OR REPLACE INTO maintenance (key, value) VALUES ('last_vacuum', ?);", (now.isoformat(),))
+        conn.commit()
+        print("Compacting database.")
+        conn.execute("VACUUM;")
+
 def init_announced_db(conn):
-    """Create a table to store auction IDs that have been announced."""
+    """
+    Create a table to store auction IDs that have been announced, and when, then prune the
+    announcements older than ANNOUNCED_TTL_HOURS.
+    """
     conn.execute("""
         CREATE TABLE IF NOT EXISTS announced_auctions (
-            auction_id TEXT PRIMARY KEY
+            auction_id TEXT PRIMARY KEY,
+            announced_at TEXT
         );
     """)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(announced_auctions);")}
+    if "announced_at" not in columns:
+        # Announcements from before the timestamp was stored expire one TTL from now.
+        conn.execute("ALTER TABLE announced_auctions ADD COLUMN announced_at TEXT;")
+        conn.execute("UPDATE announced_auctions SET announced_at = ?;",
+                     (datetime.datetime.now(datetime.timezone.utc).isoformat(),))
+    conn.execute("CREATE INDEX IF NOT EXISTS announced_auctions_announced_at ON announced_auctions (announced_at);")
+    prune_announced_auctions(conn)
     conn.commit()
 
-def load_announced_auctions(conn):
-    """Return a set of auction IDs that have already been announced."""
-    cursor = conn.execute("SELECT auction_id FROM announced_auctions;")
-    return {row[0] for row in cursor.fetchall()}    
+def get_announced_cutoff():
+    """Announcements older than this ISO timestamp are expired."""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return (now - datetime.timedelta(hours=ANNOUNCED_TTL_HOURS)).isoformat()
+
+def prune_announced_auctions(conn):
+    """Delete expired announcements; their auctions have ended. Does not commit."""
+    deleted = conn.execute("DELETE FROM announced_auctions WHERE announced_at < ?;", (get_announced_cutoff(),)).rowcount
+    if deleted:
+        print(f"Pruned {deleted} expired announced auctions.")
+
+def load_announced_auctions(conn, auction_ids=None):
+    """
+    Return the set of auction IDs that have been announced within ANNOUNCED_TTL_HOURS.
+    auction_ids limits the lookup to the given auctions, e.g. the current candidates,
+    so the announcement history is never loaded as a whole.
+    """
+    if auction_ids is None:
+        cursor = conn.execute("SELECT auction_id FROM announced_auctions WHERE announced_at >= ?;",
+                              (get_announced_cutoff(),))
+        return {row[0] for row in cursor.fetchall()}
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS candidate_auctions (auction_id TEXT PRIMARY KEY);")
+    conn.execute("DELETE FROM candidate_auctions;")
+    conn.executemany("INSERT OR IGNORE INTO candidate_auctions (auction_id) VALUES (?);",
+                     ((str(auction_id),) for auction_id in auction_ids))
+    cursor = conn.execute("""
+        SELECT a.auction_id
+        FROM candidate_auctions c
+        JOIN announced_auctions a ON a.auction_id = c.auction_id
+        WHERE a.announced_at >= ?;
+    """, (get_announced_cutoff(),))
+    return {row[0] for row in cursor.fetchall()}
 
 def save_announced_auctions(conn, items):
-    """Insert the auction IDs of the items that have been announced."""
-    for item in items:
-        auction_id = str(item["auction_id"])
-        try:
-            conn.execute("INSERT INTO announced_auctions (auction_id) VALUES (?);", (auction_id,))
-        except sqlite3.IntegrityError:
-            # Auction ID already exists; skip it.
-            pass
+    """Insert the auction IDs of the items that have been announced, skipping known ones."""
+    announced_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    conn.executemany(
+        "INSERT OR IGNORE INTO announced_auctions (auction_id, announced_at) VALUES (?, ?);",
+        ((str(item["auction_id"]), announced_at) for item in items)
+    )
     conn.commit()
 
-def process_files(conn, relevant_realms):
+def process_files(conn, relevant_realms, files=None, eligibility=None, workers=None):
     """
-    Process auction JSON files, filtering by relevant realms.
+    Process auction files (JSON or columnar snapshots), filtering by relevant realms.
     Aggregates data by (realm, item_id, bonus_key) to get the minimum buyout.
-    Returns the temporary list of full auction records.
+    files defaults to every file in AUCTIONS_DIR, in which case commodity prices are stored too.
+    With eligibility (see load_eligibility), records that can never qualify are dropped early.
+    Files are parsed by up to workers processes (PARSE_WORKERS by default), which are handed
+    the bonus table loaded here rather than loading it themselves.
+    Returns the AuctionRecords of the relevant realms that were kept.
     """
-    files = glob.glob(os.path.join(AUCTIONS_DIR, "*.json"))
+    include_commodities = files is None
+    if files is None:
+        files = list_auction_files(AUCTIONS_DIR)
+    if workers is None:
+        workers = PARSE_WORKERS
     batch_data = {}   # Key: (realm, item_id, bonus_key)
-    full_records = [] # List of full records (only from relevant realms)
+    full_records = [] # Records kept by aggregate_file (only from relevant realms)
     timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    keep_record = None
+    if eligibility is not None:
+        keep_record = partial(may_qualify, eligibility=eligibility, special_items=load_special_items())
+
+    dropped = {}      # Key: item_id -> records dropped by keep_record
+    with report.stage("parse_files"):
+        in_workers = workers > 1 and len(files) > 1
+        if in_workers:
+            bonus_table = load_bonus_table()
+            with concurrent.futures.ProcessPoolExecutor(min(workers, len(files)), initializer=init_parse_worker,
+                                                        initargs=(bonus_table,)) as executor:
+                results = list(executor.map(aggregate_file, files, repeat(relevant_realms), repeat(keep_record)))
+        else:
+            results = (aggregate_file(file, relevant_realms, keep_record) for file in files)
+
+        for minima, records, stats in results:
+            full_records.extend(records)
+            for key, buyout in minima.items():
+                if key not in batch_data or buyout < batch_data[key]:
+                    batch_data[key] = buyout
+            report.count("files", 1)
+            report.count("files_rejected_realm", stats["skipped"])
+            report.count("records_parsed", stats["parsed"])
+            for item_id, count in stats["dropped"].items():
+                dropped[item_id] = dropped.get(item_id, 0) + count
+            if in_workers:
+                # Lookups in this process are reported from its own cache (see report_cache_stats).
+                report.cache("bonus_keys", *stats["bonus_keys"])
+        count_rejections(dropped, eligibility)
+
+    if include_commodities:
+        batch_data.update(get_commodity_batch())
     
-    for file in files:
-        records = parse_file(file)
-        for record in records:
-            realm, auction_id, item_id, buyout, quantity, time_left, bonus_lists, ts = record
-            if realm not in relevant_realms:
-                continue
-            full_records.append(record)
-            bonus_key = get_bonus_key(bonus_lists)
-            key = (realm, item_id, bonus_key)
-            if key not in batch_data or buyout < batch_data[key]:
-                batch_data[key] = buyout
-    
-    # Insert aggregated data into the database.
-    for (realm, item_id, bonus_key), min_buyout in batch_data.items():
-        conn.execute("""
-            INSERT INTO item_prices (realm, item_id, bonus_key, min_buyout, timestamp)
-            VALUES (?, ?, ?, ?, ?);
-        """, (realm, item_id, bonus_key, min_buyout, timestamp))
-    conn.commit()
+    with report.stage("insert_prices"):
+        insert_prices(conn, batch_data, timestamp)
     return full_records
 
-def parse_file(file):
+def init_parse_worker(bonus_table):
+    """Start a process_files worker with the parent's bonus table (see load_bonus_table)."""
+    if os.path.exists(RAIDERIO_BONUS_FILE):
+        preload_reference(RAIDERIO_BONUS_FILE, bonus_table)
+
+def aggregate_file(file, relevant_realms, keep_record=None):
     """
-    Parse a single JSON file from AUCTIONS_DIR and return a list of auction records.
-    Each record is a tuple: (realm, auction_id, item_id, buyout, quantity, time_left, bonus_lists, timestamp)
+    Parse one auction file and pre-aggregate it, run in a worker process by process_files.
+    Files of other realms are skipped before any auction is decoded, and auctions are streamed,
+    so only the kept records are held in memory.
+    Returns (minima, records, stats): the minimum buyout per (realm, item_id, bonus_key) of the relevant realms,
+    their records that pass keep_record (all of them without one), and counts for the run report:
+    whether the file was skipped, records parsed, dropped records per item_id and bonus key cache (hits, misses).
     """
+    minima = {}
     records = []
+    dropped = {}
+    parsed = 0
+    bonus_cache = resolve_bonus_key.cache_info()
     try:
-        with open(file, "r") as f:
-            data = json.load(f)
+        realm = get_file_realm(file)
+        if realm not in relevant_realms:
+            return minima, records, {"skipped": 1, "parsed": 0, "dropped": {}, "bonus_keys": (0, 0)}
+        for record in parse_file(file, realm):
+            parsed += 1
+            if keep_record is None or keep_record(record):
+                records.append(record)
+            else:
+                dropped[record.item_id] = dropped.get(record.item_id, 0) + 1
+            key = (realm, record.item_id, get_bonus_key(record.bonus_lists))
+            if key not in minima or record.buyout < minima[key]:
+                minima[key] = record.buyout
     except Exception as e:
         print(f"Error processing {file}: {e}")
-        return records
+        minima, records, dropped = {}, [], {}
+    after = resolve_bonus_key.cache_info()
+    bonus_keys = (after.hits - bonus_cache.hits, after.misses - bonus_cache.misses)
+    return minima, records, {"skipped": 0, "parsed": parsed, "dropped": dropped, "bonus_keys": bonus_keys}
 
-    # Determine realm using connected_realm href; fallback to filename
-    realm = data.get("connected_realm", {}).get("href", "")
+def may_qualify(record, eligibility, special_items):
+    """
+    Whether an auction can qualify regardless of its baseline: its item is eligible and it meets
+    the item's minimum buyout, or it is a special item. Items missing from eligibility may qualify.
+    """
+    rules = eligibility.get(record.item_id, ())
+    if rules is None:
+        return False
+    if str(record.auction_id) in special_items:
+        return True
+    return not rules or record.buyout >= rules[0]
+
+def count_rejections(dropped, eligibility):
+    """
+    Add the records dropped by may_qualify (item_id -> count) to the run report by reason:
+    the minimum buyout for eligible items, otherwise why the item is not eligible.
+    """
+    reasons = getattr(eligibility, "reasons", {})
+    for item_id, count in dropped.items():
+        if eligibility.get(item_id) is not None:
+            reason = "min_buyout"
+        else:
+            reason = reasons.get(item_id, "ineligible")
+        report.count(f"records_rejected_{reason}", count)
+
+def get_commodity_batch():
+    """
+    Commodities are region-wide and already aggregated per item by auctionDataRequest.py.
+    Returns their minimum unit prices keyed like process_files batches, under COMMODITIES_REALM.
+    """
+    return {
+        (COMMODITIES_REALM, int(item_id), ""): prices["min_unit_price"]
+        for item_id, prices in load_commodity_prices().items()
+    }
+
+def process_commodities(conn):
+    """Store the current commodity prices on their own, e.g. once a pipelined fetch saved them."""
+    timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    insert_prices(conn, get_commodity_batch(), timestamp)
+
+def insert_prices(conn, batch_data, timestamp):
+    """
+    Insert aggregated minimum buyouts keyed by (realm, item_id, bonus_key) into the database
+    and fold them into item_price_stats (and item_price_sketches with BASELINE_QUANTILE) in the same transaction.
+    """
+    conn.executemany("""
+        INSERT OR IGNORE INTO item_prices (realm, item_id, bonus_key, min_buyout, timestamp)
+        VALUES (?, ?, ?, ?, ?);
+    """, ((realm, item_id, bonus_key, min_buyout, timestamp)
+          for (realm, item_id, bonus_key), min_buyout in batch_data.items()))
+    update_price_stats(conn, batch_data, timestamp)
+    if BASELINE_QUANTILE is not None:
+        update_price_sketches(conn, batch_data)
+    conn.commit()
+
+def update_price_stats(conn, batch_data, timestamp):
+    """
+    Add a batch of (realm, item_id, bonus_key) -> min_buyout observations to item_price_stats,
+    once per realm and once for ALL_REALMS. Does not commit.
+    """
+    stats = {}  # Key: (item_id, bonus_key, realm) -> [count, total, total_sq]
+    for (realm, item_id, bonus_key), min_buyout in batch_data.items():
+        for key in ((item_id, bonus_key, realm), (item_id, bonus_key, ALL_REALMS)):
+            entry = stats.setdefault(key, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += min_buyout
+            entry[2] += float(min_buyout) * min_buyout
+    conn.executemany("""
+        INSERT INTO item_price_stats (item_id, bonus_key, realm, count, total, total_sq, ewma, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (item_id, bonus_key, realm) DO UPDATE SET
+            count = count + excluded.count,
+            total = total + excluded.total,
+            total_sq = total_sq + excluded.total_sq,
+            ewma = ewma + ? * (excluded.ewma - ewma),
+            updated_at = excluded.updated_at;
+    """, (
+        # A batch of n observations decays the previous mean n times.
+        (item_id, bonus_key, realm, count, total, total_sq, total / count, timestamp, 1 - (1 - EWMA_ALPHA) ** count)
+        for (item_id, bonus_key, realm), (count, total, total_sq) in stats.items()
+    ))
+
+def load_price_sketches(conn, keys):
+    """Return the stored sketches of the given (item_id, bonus_key, realm) keys that exist."""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted_sketches (item_id INTEGER, bonus_key TEXT, realm TEXT);")
+    conn.execute("DELETE FROM wanted_sketches;")
+    conn.executemany("INSERT INTO wanted_sketches (item_id, bonus_key, realm) VALUES (?, ?, ?);", keys)
+    cursor = conn.execute("""
+        SELECT s.item_id, s.bonus_key, s.realm, s.sketch
+        FROM item_price_sketches s
+        JOIN wanted_sketches w ON w.item_id = s.item_id AND w.bonus_key = s.bonus_key AND w.realm = s.realm;
+    """)
+    return {(item_id, bonus_key, realm): KLLSketch.from_bytes(blob) for item_id, bonus_key, realm, blob in cursor}
+
+def save_price_sketches(conn, sketches):
+    """Store sketches keyed by (item_id, bonus_key, realm). Does not commit."""
+    conn.executemany(
+        "INSERT OR REPLACE INTO item_price_sketches (item_id, bonus_key, realm, sketch) VALUES (?, ?, ?, ?);",
+        ((item_id, bonus_key, realm, sketch.to_bytes()) for (item_id, bonus_key, realm), sketch in sketches.items())
+    )
+
+def update_price_sketches(conn, batch_data):
+    """
+    Add a batch of (realm, item_id, bonus_key) -> min_buyout observations to item_price_sketches,
+    once per realm and once for ALL_REALMS. Does not commit.
+    """
+    observations = {}  # Key: (item_id, bonus_key, realm) -> [min_buyout, ...]
+    for (realm, item_id, bonus_key), min_buyout in batch_data.items():
+        observations.setdefault((item_id, bonus_key, realm), []).append(min_buyout)
+        observations.setdefault((item_id, bonus_key, ALL_REALMS), []).append(min_buyout)
+    sketches = load_price_sketches(conn, observations.keys())
+    for key, prices in observations.items():
+        sketch = sketches.setdefault(key, KLLSketch())
+        for price in prices:
+            sketch.update(price)
+    save_price_sketches(conn, sketches)
+
+def merge_price_sketches(conn, other_db_file):
+    """
+    Merge the item_price_sketches of another database, e.g. one written by a sharded run over a
+    different set of realms, into this one. Commits.
+    """
+    other = sqlite3.connect(other_db_file)
+    try:
+        incoming = {
+            (item_id, bonus_key, realm): KLLSketch.from_bytes(blob)
+            for item_id, bonus_key, realm, blob in other.execute(
+                "SELECT item_id, bonus_key, realm, sketch FROM item_price_sketches;"
+            )
+        }
+    finally:
+        other.close()
+    sketches = load_price_sketches(conn, incoming.keys())
+    for key, sketch in incoming.items():
+        if key in sketches:
+            sketches[key].merge(sketch)
+        else:
+            sketches[key] = sketch
+    save_price_sketches(conn, sketches)
+    conn.commit()
+    print(f"Merged {len(incoming)} price sketches from {other_db_file}.")
+
+class AuctionRecord:
+    """
+    One auction of a realm file.
+    Unpacks like a tuple: (realm, auction_id, item_id, buyout, quantity, time_left, bonus_lists, timestamp)
+    """
+    __slots__ = ("realm", "auction_id", "item_id", "buyout", "quantity", "time_left", "bonus_lists", "timestamp")
+
+    def __init__(self, realm, auction_id, item_id, buyout, quantity, time_left, bonus_lists, timestamp):
+        self.realm = realm
+        self.auction_id = auction_id
+        self.item_id = item_id
+        self.buyout = buyout
+        self.quantity = quantity
+        self.time_left = time_left
+        self.bonus_lists = bonus_lists
+        self.timestamp = timestamp
+
+    def __iter__(self):
+        return iter((self.realm, self.auction_id, self.item_id, self.buyout,
+                     self.quantity, self.time_left, self.bonus_lists, self.timestamp))
+
+    def __reduce__(self):
+        return AuctionRecord, tuple(self)
+
+def get_file_realm(file):
+    """
+    Determine the realm of an auction file from its header, without decoding any auction.
+    Uses the connected_realm href, falling back to the filename.
+    """
+    realm = read_auction_header(file).get("connected_realm", {}).get("href", "")
     if realm:
         realm = realm.split("/")[-1]
         realm = realm.split('?')[0]
     else:
         realm = os.path.basename(file).split(".")[0]
+    return realm
 
+def parse_file(file, realm=None):
+    """
+    Stream the auctions of a single file from AUCTIONS_DIR as AuctionRecords.
+    Both JSON files and columnar snapshots are supported.
+    realm is looked up with get_file_realm if not given.
+    """
+    if realm is None:
+        realm = get_file_realm(file)
     timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
-    auctions = data.get("auctions", [])
-    for auction in auctions:
-        item = auction.get("item", {})
-        bonus_lists = item.get("bonus_lists", [])  # Capture bonus IDs
-        record = (
-            realm,
-            auction.get("id"),
-            item.get("id"),
-            auction.get("buyout", 0),
-            auction.get("quantity", 1),
-            auction.get("time_left", ""),
-            bonus_lists,  # New field
-            timestamp
-        )
-        records.append(record)
-    return records
-def get_historical_averages(conn):
+    for auction_id, item_id, buyout, quantity, time_left, bonus_lists in iter_auction_rows(file):
+        yield AuctionRecord(realm, auction_id, item_id, buyout, quantity, time_left, tuple(bonus_lists), timestamp)
+
+def get_price_stats(conn, keys=None, realm=ALL_REALMS):
+    """
+    Read the materialised price aggregates of a realm (ALL_REALMS for the whole history).
+    keys limits the lookup to the given (item_id, bonus_key) variants.
+    Returns a dictionary mapping (item_id, bonus_key) to (count, mean, stddev, ewma).
     """
-    Calculate historical average buyout per item variant (grouped by item_id and bonus_key)
-    from the entire database.
+    query = """
+        SELECT s.item_id, s.bonus_key, s.count, s.total, s.total_sq, s.ewma
+        FROM item_price_stats s
+    """
+    if keys is not None:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted_variants (item_id INTEGER, bonus_key TEXT);")
+        conn.execute("DELETE FROM wanted_variants;")
+        conn.executemany("INSERT INTO wanted_variants (item_id, bonus_key) VALUES (?, ?);", keys)
+        query += " JOIN wanted_variants w ON w.item_id = s.item_id AND w.bonus_key = s.bonus_key"
+    cursor = conn.execute(query + " WHERE s.realm = ?;", (realm,))
+    stats = {}
+    for item_id, bonus_key, count, total, total_sq, ewma in cursor.fetchall():
+        mean = total / count
+        variance = max(total_sq / count - mean * mean, 0.0)
+        stats[(item_id, bonus_key)] = (count, mean, variance ** 0.5, ewma)
+    return stats
+
+def get_historical_averages(conn, keys=None):
+    """
+    Historical average buyout per item variant (item_id, bonus_key) over the entire history,
+    read from item_price_stats instead of averaging item_prices.
+    keys limits the lookup to the given variants, e.g. those seen in the current run.
     Returns a dictionary mapping (item_id, bonus_key) to average buyout.
     """
-    cursor = conn.execute("""
-        SELECT item_id, bonus_key, AVG(min_buyout) as avg_price
-        FROM item_prices
-        GROUP BY item_id, bonus_key;
-    """)
-    averages = { (row[0], row[1]): row[2] for row in cursor.fetchall() }
+    return {key: mean for key, (count, mean, stddev, ewma) in get_price_stats(conn, keys).items()}
+
+def get_price_quantiles(conn, q, keys=None, realm=ALL_REALMS):
+    """
+    Quantile q of the buyout history per item variant (item_id, bonus_key), read from the variant's sketch.
+    keys limits the lookup to the given variants.
+    Returns a dictionary mapping (item_id, bonus_key) to the estimated quantile.
+    """
+    if keys is None:
+        cursor = conn.execute(
+            "SELECT item_id, bonus_key, realm, sketch FROM item_price_sketches WHERE realm = ?;", (realm,)
+        )
+        sketches = {(item_id, bonus_key, realm): KLLSketch.from_bytes(blob) for item_id, bonus_key, realm, blob in cursor}
+    else:
+        sketches = load_price_sketches(conn, [(item_id, bonus_key, realm) for item_id, bonus_key in keys])
+    return {(item_id, bonus_key): sketch.quantile(q) for (item_id, bonus_key, _), sketch in sketches.items()}
+
+def get_baselines(conn, keys=None):
+    """
+    Baseline buyout per item variant that the threshold ratio is applied to: the historical average,
+    or the BASELINE_QUANTILE of its sketch when configured (falling back to the average for variants
+    without one). Returns a dictionary mapping (item_id, bonus_key) to the baseline.
+    """
+    averages = get_historical_averages(conn, keys)
+    if BASELINE_QUANTILE is None:
+        return averages
+    averages.update(get_price_quantiles(conn, BASELINE_QUANTILE, keys))
     return averages
 
 def load_relevant_realms():
@@ -154,16 +638,69 @@ def load_relevant_realms():
     Load the relevant realms from RELEVANT_REALMS_FILE.
     Expected JSON format: an object mapping realm_id to a friendly realm name.
     e.g. { "1923": "Stormwind", "1924": "Orgrimmar", ... }
+    Realm ids are translated to their connected realm id using REALM_MAP_FILE,
+    since auction files are stored per connected realm.
     """
     try:
         with open(RELEVANT_REALMS_FILE, "r") as f:
             realms = json.load(f)
-        return realms  # a dict mapping realm id to realm name
     except Exception as e:
         print(f"Error loading relevant realms: {e}")
         return {}
-@lru_cache(maxsize=10000)
+    try:
+        with open(REALM_MAP_FILE, "r") as f:
+            realm_map = json.load(f).get("realms", {})
+    except Exception as e:
+        print(f"Warning: could not load realm map {REALM_MAP_FILE}: {e}")
+        realm_map = {}
+    # Ids that are neither a member realm nor a connected realm in the map are kept as they are,
+    # which only finds their auctions if they happen to be connected realm ids.
+    connected_ids = set(realm_map.values())
+    unmapped = [realm_id for realm_id in realms if realm_id not in realm_map and realm_id not in connected_ids]
+    if unmapped:
+        print(f"Warning: realms {', '.join(unmapped)} are not in {REALM_MAP_FILE}, "
+              f"assuming they are connected realm ids.")
+    connected = {}
+    for realm_id, name in realms.items():
+        connected_id = realm_map.get(realm_id, realm_id)
+        connected[connected_id] = f"{connected[connected_id]}, {name}" if connected_id in connected else name
+    return connected  # a dict mapping connected realm id to realm name
+def load_commodity_prices():
+    """
+    Load the aggregated region commodity prices from COMMODITIES_FILE.
+    Returns a dict mapping item_id (as string) to its min/weighted unit price and quantity.
+    """
+    try:
+        with open(COMMODITIES_FILE, "r") as f:
+            return jsonBackend.load(f).get("items", {})
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"Error loading commodity prices: {e}")
+        return {}
+
+@lru_cache(maxsize=None)
+def load_item_catalog():
+    """Load data/itemCatalog.db (built by itemCatalog.py) once; see itemCatalog.load_catalog."""
+    catalog = load_catalog()
+    print(f"Loaded {len(catalog)} items from the item catalog.")
+    return catalog
+
 def load_item_data(item_id):
+    """
+    Look up an item's data in the item catalog, falling back to its JSON file in ITEMS_DIR
+    for items that have not been compiled into the catalog yet.
+    Returns the item data as a dict, or None if an error occurs.
+    """
+    item_data = load_item_catalog().get(item_id)
+    if item_data is not None:
+        report.cache("item_catalog", 1, 0)
+        return item_data
+    report.cache("item_catalog", 0, 1)
+    return load_item_file(item_id)
+
+@lru_cache(maxsize=10000)
+def load_item_file(item_id):
     """
     Load an item's JSON data from ITEMS_DIR using the item_id.
     Returns the parsed JSON as a dict, or None if an error occurs.
@@ -171,7 +708,7 @@ def load_item_data(item_id):
     item_file = os.path.join(ITEMS_DIR, f"{item_id}.json")
     try:
         with open(item_file, "r") as f:
-            return json.load(f)
+            return jsonBackend.load(f)
     except Exception as e:
         print(f"Error loading item data for item {item_id}: {e}")
         return None
@@ -182,20 +719,53 @@ def load_special_items():
     Returns a dict mapping item_id (as string) to its threshold value.
     """
     try:
-        with open(SPECIAL_ITEMS_FILE, "r") as f:
-            return json.load(f)
+        return load_reference(SPECIAL_ITEMS_FILE, json.load)
     except Exception as e:
         print(f"Error loading special items: {e}")
         return {}
 
-def load_raiderio_bonuses():
+def load_bonus_table():
+    """
+    The compiled RAIDERIO_BONUS_FILE (see compile_bonus_table), loaded on first use
+    and cached preprocessed, so importing this module does not parse it.
+    When the file changed since the last call, the memoised bonus keys and levels are cleared.
+    """
+    global _bonus_table
     try:
-        with open(RAIDERIO_BONUS_FILE, "r") as f:
-            bonuses = json.load(f)
-        return bonuses  
+        table = load_reference(RAIDERIO_BONUS_FILE, build_bonus_table)
     except Exception as e:
-        print(f"Error loading relevant realms: {e}")
-        return {}
+        print(f"Error loading bonus ids: {e}")
+        table = EMPTY_BONUS_TABLE
+    if table is not _bonus_table:
+        resolve_bonus_key.cache_clear()
+        resolve_bonus_level.cache_clear()
+        _bonus_table = table
+    return table
+
+def build_bonus_table(f):
+    pricing_tags, level_deltas = compile_bonus_table(jsonBackend.load(f))
+    print(f"Compiled {len(pricing_tags)} pricing bonus ids and {len(level_deltas)} item level bonus ids.")
+    return pricing_tags, level_deltas
+
+def compile_bonus_table(bonuses):
+    """
+    Reduce RaiderIO's bonus mapping to the parts auctions are keyed and displayed by.
+    Returns (pricing_tags, level_deltas), both keyed by integer bonus id:
+    pricing_tags holds the tag of every bonus that affects pricing (like ilvl changes, sockets, extra stats),
+    level_deltas the item level change of every bonus with a "level" field.
+    """
+    pricing_tags = {}
+    level_deltas = {}
+    for bid, bonus_info in bonuses.items():
+        if not bonus_info:
+            continue
+        # Assume bonus_info contains a field 'affectsPricing' or similar,
+        # or you could check if bonus_info includes known keys like 'ilvl_up' or 'socket'.
+        if bonus_info.get("affectsPricing", False) or bonus_info.get("category") in ("ilvl", "socket", "tertiary"):
+            pricing_tags[int(bid)] = bonus_info.get("tag", str(bid))
+        if "level" in bonus_info:
+            level_deltas[int(bid)] = bonus_info["level"]
+    return pricing_tags, level_deltas
 
 def get_bonus_key(bonus_lists):
     """
@@ -204,20 +774,23 @@ def get_bonus_key(bonus_lists):
     """
     if not bonus_lists:
         return ""
-    relevant_bonuses = []
-    for bid in bonus_lists:
-        bonus_info = RAIDERIO_BONUSES.get(str(bid))
-        if bonus_info:
-            # Assume bonus_info contains a field 'affectsPricing' or similar,
-            # or you could check if bonus_info includes known keys like 'ilvl_up' or 'socket'.
-            if bonus_info.get("affectsPricing", False) or bonus_info.get("category") in ("ilvl", "socket", "tertiary"):
-                # For clarity, you might use a simplified tag:
-                tag = bonus_info.get("tag", str(bid))
-                relevant_bonuses.append(tag)
+    return resolve_bonus_key(tuple(bonus_lists))
+
+@lru_cache(maxsize=65536)
+def resolve_bonus_key(bonus_ids):
+    """get_bonus_key for a tuple of bonus ids, memoised since few distinct combinations occur."""
+    pricing_tags = load_bonus_table()[0]
+    relevant_bonuses = [pricing_tags[bid] for bid in bonus_ids if bid in pricing_tags]
     if not relevant_bonuses:
         return ""
     return "-".join(sorted(relevant_bonuses))
 
+@lru_cache(maxsize=65536)
+def resolve_bonus_level(bonus_ids):
+    """Total item level change of a tuple of bonus ids."""
+    level_deltas = load_bonus_table()[1]
+    return sum(level_deltas.get(bid, 0) for bid in bonus_ids)
+
 def calculate_effective_ilvl(base_ilvl, bonus_lists):
     """
     Calculate the effective item level by adding bonus level adjustments.
@@ -225,23 +798,20 @@ def calculate_effective_ilvl(base_ilvl, bonus_lists):
     base_ilvl: the base item level (as an int).
     bonus_lists: a list of bonus IDs (numbers).
     
-    The function looks up each bonus ID in the RAIDERIO_BONUSES mapping (loaded from BonusIds.json)
-    and, if the bonus contains a "level" field, adds that value to the base_ilvl.
+    The function looks up each bonus ID in the level deltas of load_bonus_table (compiled from BonusIds.json)
+    and adds its level change to the base_ilvl.
     """
     try:
         effective_ilvl = int(base_ilvl) if base_ilvl is not None else 0
     except ValueError:
         effective_ilvl = 0
 
-    for bid in bonus_lists:
-        bonus_info = RAIDERIO_BONUSES.get(str(bid))
-        if bonus_info and "level" in bonus_info:
-            effective_ilvl += bonus_info["level"]
+    if bonus_lists:
+        effective_ilvl += resolve_bonus_level(tuple(bonus_lists))
     return effective_ilvl
 def load_expansion_data():
     try:
-        with open(EXPANSION_FILE, "r") as f:
-            return json.load(f)
+        return load_reference(EXPANSION_FILE, jsonBackend.load)
     except Exception as e:
         print(f"Error loading expansion data: {e}")
         return {}
@@ -255,8 +825,7 @@ def compute_latest_expansion(expansion_data):
 
 def load_expansion_presets():
     try:
-        with open(ITEM_CLASSES_FILE, "r") as f:
-            return json.load(f)
+        return load_reference(ITEM_CLASSES_FILE, json.load)
     except Exception as e:
         print(f"Error loading expansion presets: {e}")
         return {}
@@ -277,12 +846,18 @@ def get_localized_value(val, lang="en_US"):
     return ""
 
 
-def cross_reference_item(record, avg, special_items, expansion_data, presets, latest_expansion):
-    realm, auction_id, item_id, buyout, quantity, time_left, bonus_lists, timestamp = record
-    item_data = load_item_data(item_id)
-    if not item_data:
-        return None
+def get_item_rules(item_data, item_id, expansion_data, presets, latest_expansion):
+    """
+    Apply the ITEM_CLASSES_FILE presets to an item.
+    Returns its (min_buyout, threshold_ratio) if auctions of the item may qualify, otherwise None.
+    """
+    return check_item_rules(item_data, item_id, expansion_data, presets, latest_expansion)[0]
 
+def check_item_rules(item_data, item_id, expansion_data, presets, latest_expansion):
+    """
+    Like get_item_rules, but returns (rules, reason) where reason names the preset filter
+    that rejected the item ("expansion", "class_preset" or "quality"), None if it may qualify.
+    """
     exp_info = expansion_data.get(str(item_id))
     expansion_id = exp_info.get("ExpansionID", 0) if exp_info else 0
 
@@ -290,32 +865,116 @@ def cross_reference_item(record, avg, special_items, expansion_data, presets, la
     item_class = get_localized_value(item_class_raw).lower()
 
     preset = presets.get(item_class)
-    if preset:
-        allowed_expansions = preset.get("allowed_expansions", "all")
-        allowed_qualities = preset.get("allowed_qualities", "all")
-        allowed_subclasses = preset.get("allowed_subclass", "all")
-        
-        if allowed_expansions == "latest":
-            allowed_expansions = {latest_expansion}
-        
-        if allowed_expansions != "all" and expansion_id not in allowed_expansions:
-            return None
+    if not preset:
+        return (MIN_BUYOUT, THRESHOLD_RATIO), None
 
-        if allowed_subclasses != "all":
-            item_subclass_raw = item_data.get("item_subclass", "").get("name", "")
-            item_subclass = get_localized_value(item_subclass_raw).lower()
-            if item_subclass not in allowed_subclasses:
-                return None
+    allowed_expansions = preset.get("allowed_expansions", "all")
+    allowed_qualities = preset.get("allowed_qualities", "all")
+    allowed_subclasses = preset.get("allowed_subclass", "all")
 
-        quality = get_localized_value(item_data.get("quality", "").get("name", "")).upper()
-        if allowed_qualities != "all" and quality not in allowed_qualities:
-            return None
-    else:
-        print(f"Item class for item {item_id} is: {item_class} and subclass is {get_localized_value(item_data.get('item_subclass', ''))}")
-        quality = get_localized_value(item_data.get("quality", "").get("name", "")).upper()
+    if allowed_expansions == "latest":
+        allowed_expansions = {latest_expansion}
+
+    if allowed_expansions != "all" and expansion_id not in allowed_expansions:
+        return None, "expansion"
+
+    if allowed_subclasses != "all":
+        item_subclass_raw = item_data.get("item_subclass", "").get("name", "")
+        item_subclass = get_localized_value(item_subclass_raw).lower()
+        if item_subclass not in allowed_subclasses:
+            return None, "class_preset"
+
+    quality = get_localized_value(item_data.get("quality", "").get("name", "")).upper()
+    if allowed_qualities != "all" and quality not in allowed_qualities:
+        return None, "quality"
+
+    return (preset.get("min_buyout_overwrite", MIN_BUYOUT), preset.get("threshold_ratio_overwrite", THRESHOLD_RATIO)), None
+
+def get_eligibility_key():
+    """Hash of everything the compiled eligibility depends on."""
+    digest = hashlib.sha256(repr((MIN_BUYOUT, THRESHOLD_RATIO)).encode())
+    for path in (ITEM_CLASSES_FILE, EXPANSION_FILE, CATALOG_FILE):
+        try:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+        except FileNotFoundError:
+            digest.update(b"missing")
+    return digest.hexdigest()
+
+class Eligibility(dict):
+    """
+    The compiled eligibility: item_id -> (min_buyout, threshold_ratio), or None for items whose
+    auctions can never qualify. reasons maps those items to the filter that rejected them.
+    """
+    def __init__(self, items=(), reasons=None):
+        super().__init__(items)
+        self.reasons = reasons if reasons is not None else {}
+
+def compile_eligibility(expansion_data, presets, latest_expansion):
+    """
+    Apply the presets to every item of the item catalog once.
+    Returns an Eligibility mapping item_id to its (min_buyout, threshold_ratio), or to None for items
+    whose auctions can never qualify.
+    """
+    eligibility = Eligibility()
+    unconfigured = set()
+    for item_id, item_data in load_item_catalog().items():
+        item_class = get_localized_value(item_data.get("item_class", {}).get("name", "")).lower()
+        if item_class not in presets:
+            unconfigured.add(item_class)
+        rules, reason = check_item_rules(item_data, item_id, expansion_data, presets, latest_expansion)
+        eligibility[item_id] = rules
+        if reason:
+            eligibility.reasons[item_id] = reason
+    if unconfigured:
+        print(f"Item classes without a preset, using the default thresholds: {', '.join(sorted(unconfigured))}")
+    return eligibility
 
-    threshold = preset.get("min_buyout_overwrite", MIN_BUYOUT) if preset else MIN_BUYOUT
-    ratio = preset.get("threshold_ratio_overwrite", THRESHOLD_RATIO) if preset else THRESHOLD_RATIO
+def load_eligibility(expansion_data, presets, latest_expansion):
+    """
+    Return the compiled eligibility (see compile_eligibility), cached in ELIGIBILITY_CACHE_FILE
+    until ITEM_CLASSES_FILE, EXPANSION_FILE or the item catalog change.
+    """
+    key = get_eligibility_key()
+    try:
+        with open(ELIGIBILITY_CACHE_FILE, "r") as f:
+            cached = jsonBackend.load(f)
+        if cached.get("key") == key and "reasons" in cached:
+            return Eligibility(
+                ((int(item_id), tuple(rules) if rules else None) for item_id, rules in cached["items"].items()),
+                {int(item_id): reason for item_id, reason in cached.get("reasons", {}).items()},
+            )
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Error loading eligibility cache: {e}")
+
+    eligibility = compile_eligibility(expansion_data, presets, latest_expansion)
+    try:
+        os.makedirs(os.path.dirname(ELIGIBILITY_CACHE_FILE), exist_ok=True)
+        tmp_path = ELIGIBILITY_CACHE_FILE + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"key": key, "items": eligibility, "reasons": eligibility.reasons}, f, separators=(",", ":"))
+        os.replace(tmp_path, ELIGIBILITY_CACHE_FILE)
+    except OSError as e:
+        print(f"Could not cache eligibility: {e}")
+    return eligibility
+
+def cross_reference_item(record, avg, special_items, expansion_data, presets, latest_expansion, rules=None):
+    """
+    Check whether an auction qualifies as a snipe and return its extended data, otherwise None.
+    rules are the item's (min_buyout, threshold_ratio) if already known from the compiled eligibility.
+    """
+    realm, auction_id, item_id, buyout, quantity, time_left, bonus_lists, timestamp = record
+    if rules is None:
+        item_data = load_item_data(item_id)
+        if not item_data:
+            return None
+        rules = get_item_rules(item_data, item_id, expansion_data, presets, latest_expansion)
+        if rules is None:
+            return None
+    threshold, ratio = rules
 
     special_threshold = special_items.get(str(auction_id))
     if special_threshold is not None and buyout < special_threshold:
@@ -328,6 +987,10 @@ def cross_reference_item(record, avg, special_items, expansion_data, presets, la
     if not qualifies:
         return None
 
+    item_data = load_item_data(item_id)
+    if not item_data:
+        return None
+
     # Retrieve base ilvl and calculate effective ilvl using bonus modifications.
     base_ilvl = item_data.get("level") or item_data.get("item_level") or 0
     effective_ilvl = calculate_effective_ilvl(base_ilvl, bonus_lists)
@@ -351,33 +1014,69 @@ def cross_reference_item(record, avg, special_items, expansion_data, presets, la
     }
 
 
-def process_record(record, averages, special_items, expansion_data, expansion_presets, latest_expansion):
+def process_record(record, averages, special_items, expansion_data, expansion_presets, latest_expansion, eligibility=None):
     realm, auction_id, item_id, buyout, quantity, time_left, bonus_lists, timestamp = record
+    rules = None
+    if eligibility is not None and item_id in eligibility:
+        rules = eligibility[item_id]
+        if rules is None:
+            return None
     bonus_key = get_bonus_key(bonus_lists)
     avg = averages.get((item_id, bonus_key))
     if not avg:
         return None
-    extended = cross_reference_item(record, avg, special_items, expansion_data, expansion_presets, latest_expansion)
+    extended = cross_reference_item(record, avg, special_items, expansion_data, expansion_presets, latest_expansion, rules)
     if extended:
         extended["bonus_key"] = bonus_key
         return (realm, item_id, extended)
     return None
 
 
-def find_cheap_items(new_records, averages, relevant_realms, expansion_data, expansion_presets, announced_ids, latest_expansion):
+def find_cheap_items(new_records, averages, relevant_realms, expansion_data, expansion_presets, announced_ids, latest_expansion, eligibility=None,
+                     limit=ANNOUNCE_LIMIT):
     """
     Filter full auction records (only from relevant realms) to include one entry per (realm, item_id)
     using the minimum buyout. Returns a list of dictionaries with extended auction/item data.
+    eligibility is the compiled per-item eligibility (see load_eligibility), items not in it are
+    checked against the presets directly.
+    announced_ids is a set of announced auction ids (as strings), or a function returning the
+    announced ones among the given candidate auction ids, e.g. a bound load_announced_auctions.
+    At most limit items are returned, cheapest first; None returns every unannounced candidate.
     """
-    candidates = {}
     # Load special items only once.
     special_items = load_special_items()
     
-    # Import partial to fix extra arguments for process_record.
-    from functools import partial
+    # Fix extra arguments for process_record.
     process_func = partial(process_record, averages=averages, special_items=special_items,
-                             expansion_data=expansion_data, expansion_presets=expansion_presets, latest_expansion=latest_expansion)
-    
+                             expansion_data=expansion_data, expansion_presets=expansion_presets, latest_expansion=latest_expansion,
+                             eligibility=eligibility)
+
+    numpy_engine = load_numpy_engine() if eligibility is not None else None
+    if numpy_engine:
+        candidates = find_candidates_numpy(numpy_engine, new_records, averages, special_items, eligibility, process_func)
+    else:
+        candidates = find_candidates(new_records, process_func)
+
+    candidate_list = list(candidates.values())
+    candidate_list.sort(key=lambda x: x["buyout"])
+    if callable(announced_ids):
+        # Only the candidates are looked up, not every record.
+        announced_ids = announced_ids(item["auction_id"] for item in candidate_list)
+    filtered_candidates = [item for item in candidate_list if str(item["auction_id"]) not in announced_ids]
+    # Records that did not become a candidate: above their threshold, without a baseline,
+    # or not the cheapest qualifying auction of their realm and item.
+    report.count("records_evaluated", len(new_records))
+    report.count("records_rejected_threshold", len(new_records) - len(candidate_list))
+    report.count("records_rejected_announced", len(candidate_list) - len(filtered_candidates))
+
+    return filtered_candidates[:limit]
+
+def find_candidates(new_records, process_func):
+    """
+    Run process_func (a bound process_record) over every record.
+    Returns a dict mapping (realm, item_id) to the extended data of its cheapest qualifying auction.
+    """
+    candidates = {}
     with concurrent.futures.ThreadPoolExecutor(max_workers=None) as executor:
         results = list(executor.map(process_func, new_records))
     
@@ -388,12 +1087,46 @@ def find_cheap_items(new_records, averages, relevant_realms, expansion_data, exp
         key = (realm, item_id)
         if key not in candidates or extended["buyout"] < candidates[key]["buyout"]:
             candidates[key] = extended
+    return candidates
 
-    candidate_list = list(candidates.values())
-    candidate_list.sort(key=lambda x: x["buyout"])
-    filtered_candidates = [item for item in candidate_list if str(item["auction_id"]) not in announced_ids]
+def load_numpy_engine():
+    """Return the numpyEngine module if SNIPER_ENGINE allows it and NumPy is installed, otherwise None."""
+    if SNIPER_ENGINE == "python":
+        return None
+    try:
+        import numpyEngine
+    except ImportError:
+        if SNIPER_ENGINE == "numpy":
+            print("NumPy is not installed, falling back to the Python engine.")
+        return None
+    return numpyEngine
 
-    return filtered_candidates[:5]
+def find_candidates_numpy(numpy_engine, new_records, averages, special_items, eligibility, process_func):
+    """
+    Same result as find_candidates, but with the thresholds evaluated in bulk by numpyEngine;
+    only the qualifying auctions and those of items missing from eligibility go through process_func.
+    """
+    qualifying, fallback = numpy_engine.select_qualifying(new_records, averages, eligibility, special_items, get_bonus_key)
+    found = {}  # Key: (realm, item_id) -> (position of its first qualifying record, extended)
+    for index in qualifying:
+        key = (new_records[index].realm, new_records[index].item_id)
+        if key in found:
+            # Qualifying records come cheapest first per (realm, item_id); keep the earliest position
+            # so candidates are ordered like find_candidates orders them.
+            found[key] = (min(found[key][0], index), found[key][1])
+            continue
+        res = process_func(new_records[index])
+        if res is not None:
+            found[key] = (index, res[2])
+    for index in fallback:
+        res = process_func(new_records[index])
+        if res is None:
+            continue
+        realm, item_id, extended = res
+        key = (realm, item_id)
+        if key not in found or extended["buyout"] < found[key][1]["buyout"]:
+            found[key] = (found[key][0] if key in found else index, extended)
+    return {key: extended for key, (index, extended) in sorted(found.items(), key=lambda entry: entry[1][0])}
 
 def notify_discord(cheap_items, relevant_realms):
     """
@@ -452,6 +1185,7 @@ def notify_discord(cheap_items, relevant_realms):
         
         embeds.append(embed)
 
+    import requests  # Only needed to notify, and slow to import.
     payload = {"embeds": embeds}
     try:
         print(f"Payload is: {payload}")
@@ -467,13 +1201,22 @@ def notify_discord(cheap_items, relevant_realms):
     except Exception as e:
         print(f"Error sending Discord notification: {e}")
 
-RAIDERIO_BONUSES  = load_raiderio_bonuses()
-print(f"Loaded {len(RAIDERIO_BONUSES)} bonus ids.")
+reported_cache_stats = {}  # Cache name -> (hits, misses) already added to the run report
 
-def main():
-    conn = sqlite3.connect(DB_FILE)
-    init_db(conn)
-    init_announced_db(conn)  # initialize announced auctions table
+def report_cache_stats():
+    """Add the item metadata and bonus key cache statistics of this process since the last call to the run report."""
+    for name, cached in (("item_files", load_item_file), ("bonus_keys", resolve_bonus_key)):
+        hits, misses = cached.cache_info()[:2]
+        reported_hits, reported_misses = reported_cache_stats.get(name, (0, 0))
+        report.cache(name, hits - reported_hits, misses - reported_misses)
+        reported_cache_stats[name] = (hits, misses)
+
+
+def load_reference_data():
+    """
+    Load the realm and item filter configuration used to evaluate auctions.
+    Returns a tuple (relevant_realms, expansion_data, expansion_presets, latest_expansion, eligibility).
+    """
     relevant_realms = load_relevant_realms()
     print(f"Loaded {len(relevant_realms)} relevant realms.")
 
@@ -483,23 +1226,78 @@ def main():
     print(f"Calculated {len(expansion_presets)} expansion presets.")
     latest_expansion = compute_latest_expansion(expansion_data)
     print(f"Calculated latest expansion and it's {latest_expansion}.")
+    # Load the catalog up front rather than from the first worker thread that needs it.
+    load_item_catalog()
+    eligibility = load_eligibility(expansion_data, expansion_presets, latest_expansion)
+    print(f"{sum(rules is not None for rules in eligibility.values())} of {len(eligibility)} items are eligible.")
+    return relevant_realms, expansion_data, expansion_presets, latest_expansion, eligibility
 
-    new_records = process_files(conn, relevant_realms)
+def evaluate_files(conn, files, relevant_realms, expansion_data, expansion_presets, latest_expansion, eligibility=None,
+                   announced=None, announce=True):
+    """
+    Record the prices of the given auction files (all of AUCTIONS_DIR if None), then
+    announce the cheapest qualifying auctions that were not announced before.
+    announced is an optional set of announced auction ids (as strings) the caller keeps in memory
+    across calls, see sniperDaemon.py; it is used instead of the database lookup and kept up to date.
+    Without announce nothing is announced and every unannounced candidate is returned, so the
+    candidates of several calls can be announced together with announce_cheap_items.
+    Returns the announced items.
+    """
+    new_records = process_files(conn, relevant_realms, files, eligibility)
     print(f"Processed {len(new_records)} auction records from relevant realms.")
 
-    averages = get_historical_averages(conn)
-    print(f"Computed historical averages for {len(averages)} items.")
+    with report.stage("baselines"):
+        # Items that can never qualify need no baseline.
+        variants = {
+            (record.item_id, get_bonus_key(record.bonus_lists)) for record in new_records
+            if eligibility is None or eligibility.get(record.item_id, ()) is not None
+        }
+        averages = get_baselines(conn, variants)
+    print(f"Computed historical baselines for {len(averages)} items.")
+
+    with report.stage("find_cheap_items"):
+        announced_ids = partial(load_announced_auctions, conn) if announced is None else announced
+        cheap_items = find_cheap_items(new_records, averages, relevant_realms, expansion_data, expansion_presets, announced_ids, latest_expansion, eligibility,
+                                       limit=ANNOUNCE_LIMIT if announce else None)
+    if not announce:
+        return cheap_items
+    return announce_cheap_items(conn, cheap_items, relevant_realms, announced)
 
-    announced_ids = load_announced_auctions(conn)
-    cheap_items = find_cheap_items(new_records, averages, relevant_realms, expansion_data, expansion_presets, announced_ids, latest_expansion)
+def announce_cheap_items(conn, cheap_items, relevant_realms, announced=None):
+    """
+    Notify Discord about the ANNOUNCE_LIMIT cheapest of cheap_items and record them as announced.
+    announced is the optional in-memory set of announced auction ids, see evaluate_files.
+    Returns the announced items.
+    """
+    cheap_items = sorted(cheap_items, key=lambda x: x["buyout"])[:ANNOUNCE_LIMIT]
     print(f"Found {len(cheap_items)} candidate cheap items after filtering.")
+    report.count("items_announced", len(cheap_items))
 
     if cheap_items:
-        notify_discord(cheap_items, relevant_realms)
-        save_announced_auctions(conn, cheap_items)
+        with report.stage("notify"):
+            notify_discord(cheap_items, relevant_realms)
+            save_announced_auctions(conn, cheap_items)
+        if announced is not None:
+            announced.update(str(item["auction_id"]) for item in cheap_items)
     else:
         print("No qualifying cheap items to notify.")
+    return cheap_items
+
+def main():
+    conn = connect_db()
+    with report.stage("init_db"):
+        init_db(conn)
+        init_announced_db(conn)  # initialize announced auctions table
+    with report.stage("reference_data"):
+        reference = load_reference_data()
+    evaluate_files(conn, None, *reference)
+    with report.stage("retention"):
+        apply_retention(conn)
     conn.close()
+    report_cache_stats()
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        report.write("sniper")
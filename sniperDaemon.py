@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from email.utils import parsedate_to_datetime
+import sniper
+from auctionDataRequest import COMMODITIES_KEY, COMMODITIES_PATH, SAVE_FOLDER, SNAPSHOT_FORMAT, get_auctions_for_realm, get_commodities, load_last_modified, save_last_modified
+from auctionSnapshot import find_auction_file
+from blizzardClient import create_session, get_oauth_token
+from runReport import report
+
+# Once a realm's next snapshot is due, or while its cadence is still unknown, poll it this often until it appears.
+POLL_INTERVAL = float(os.environ.get("DAEMON_POLL_INTERVAL", 30))
+# Wait this long before polling a realm again after a failed request.
+ERROR_RETRY_INTERVAL = 300
+# Snapshot publication times remembered per realm to estimate its cadence.
+CADENCE_HISTORY = 8
+# Upper bound of a realm's estimated cadence; Blizzard publishes about once an hour.
+MAX_REFRESH_INTERVAL = 5400
+# Gaps longer than this many times the shortest recent gap are missed snapshots or downtime, not the cadence.
+GAP_OUTLIER_FACTOR = 1.5
+CADENCE_FILE = os.path.join(sniper.CACHE_DIR, "cadence.json")
+# Retention, announcement expiry, reference data reload and the run report happen this often.
+MAINTENANCE_INTERVAL = 3600
+# SQLite page cache of the daemon's connection, so price baselines stay in memory between evaluations.
+SQLITE_CACHE_KIB = 262144
+
+
+class RealmCadence:
+    """
+    Publication times of one realm's snapshots, from their Last-Modified headers.
+    The next poll is planned one interval after the last snapshot; until two snapshots
+    have been seen, the realm is polled every POLL_INTERVAL.
+    """
+    def __init__(self, last_modified=None, published=None):
+        self.last_modified = last_modified
+        self.published = published or []  # POSIX timestamps, oldest first
+        self.next_poll = 0.0
+
+    def interval(self):
+        """
+        The time between two snapshots, None while unknown: the median of the recent gaps close to
+        the shortest one, so skipped snapshots cannot stretch it, capped at MAX_REFRESH_INTERVAL.
+        """
+        gaps = [b - a for a, b in zip(self.published, self.published[1:]) if b > a]
+        if not gaps:
+            return None
+        shortest = min(gaps)
+        return min(statistics.median(gap for gap in gaps if gap <= GAP_OUTLIER_FACTOR * shortest), MAX_REFRESH_INTERVAL)
+
+    def observe(self, last_modified, now=None):
+        """
+        Record a newly saved snapshot. With now, e.g. for a Last-Modified value saved by an earlier run,
+        it only counts towards the cadence if it was published within MAX_REFRESH_INTERVAL.
+        """
+        self.last_modified = last_modified
+        published = parse_http_date(last_modified)
+        if published is None or (now is not None and now - published > MAX_REFRESH_INTERVAL):
+            return
+        if not self.published or published > self.published[-1]:
+            self.published = (self.published + [published])[-CADENCE_HISTORY:]
+
+    def schedule(self, now):
+        """Plan the next poll: when the next snapshot is expected, but not sooner than POLL_INTERVAL."""
+        interval = self.interval()
+        expected = self.published[-1] + interval if interval else now
+        self.next_poll = max(expected, now + POLL_INTERVAL)
+
+
+def parse_http_date(value):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def load_cadences(keys):
+    """Return a RealmCadence per key, resuming from CADENCE_FILE and LAST_MODIFIED_PATH."""
+    try:
+        with open(CADENCE_FILE, "r") as f:
+            saved = json.load(f)
+    except FileNotFoundError:
+        saved = {}
+    except Exception as e:
+        print(f"Error loading realm cadences: {e}")
+        saved = {}
+    last_modified = load_last_modified()
+    now = time.time()
+    cadences = {}
+    for key in keys:
+        cadence = RealmCadence(published=saved.get(key, []))
+        if last_modified.get(key):
+            # Written by the scheduled workflow too, which pauses overnight.
+            cadence.observe(last_modified[key], now)
+        cadences[key] = cadence
+    return cadences
+
+
+def save_cadences(cadences):
+    """Persist the observed publication times and the Last-Modified values shared with auctionDataRequest.py."""
+    last_modified = load_last_modified()
+    last_modified.update({key: cadence.last_modified for key, cadence in cadences.items() if cadence.last_modified})
+    save_last_modified(last_modified)
+    try:
+        os.makedirs(os.path.dirname(CADENCE_FILE), exist_ok=True)
+        with open(f"{CADENCE_FILE}.tmp", "w") as f:
+            json.dump({key: cadence.published for key, cadence in cadences.items() if cadence.published}, f)
+        os.replace(f"{CADENCE_FILE}.tmp", CADENCE_FILE)
+    except OSError as e:
+        print(f"Could not save realm cadences: {e}")
+
+
+async def poll_snapshots(session, credentials, key, cadence, cadences, queue, args):
+    """
+    Poll one realm (or the commodities) on its cadence with conditional requests
+    and queue every new snapshot for evaluation.
+    """
+    while True:
+        await asyncio.sleep(max(0.0, cadence.next_poll - time.time()))
+        try:
+            token = await get_oauth_token(session, *credentials)
+            headers = {"Authorization": f"Bearer {token}"}
+            # Only send conditional requests while the snapshot is still on disk.
+            if key == COMMODITIES_KEY:
+                last_modified = cadence.last_modified if os.path.exists(COMMODITIES_PATH) else None
+                count, modified = await get_commodities(session, headers, last_modified)
+            else:
+                last_modified = cadence.last_modified if find_auction_file(SAVE_FOLDER, key) else None
+                count, modified = await get_auctions_for_realm(session, key, headers, last_modified, args.format, args.delta)
+        except Exception as e:
+            print(f"Error polling {key}: {e}")
+            report.count("poll_errors")
+            cadence.next_poll = time.time() + ERROR_RETRY_INTERVAL
+            continue
+        report.count("polls")
+        if count is not None:
+            cadence.observe(modified)
+            save_cadences(cadences)
+            await queue.put((key, parse_http_date(modified)))
+        cadence.schedule(time.time())
+        if count is not None:
+            interval = cadence.interval()
+            print(f"Next poll of {key} in {cadence.next_poll - time.time():.0f}s "
+                  f"({f'snapshots every {interval:.0f}s' if interval else 'cadence not known yet'}).")
+
+
+def connect_db():
+    conn = sniper.connect_db(check_same_thread=False)
+    conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_KIB};")
+    sniper.init_db(conn)
+    sniper.init_announced_db(conn)
+    return conn
+
+
+def reload_reference_data(reference, eligibility_key):
+    """
+    Reload the reference data if the item catalog, item classes or expansion data changed,
+    e.g. after processAuctionsRequest.py added items. Returns (reference, eligibility_key).
+    A changed bonus table is picked up too, and the bonus keys and levels memoised with the old one dropped.
+    """
+    sniper.load_bonus_table()
+    key = sniper.get_eligibility_key()
+    if reference is not None and key == eligibility_key:
+        return reference, eligibility_key
+    sniper.load_item_catalog.cache_clear()
+    return sniper.load_reference_data(), key
+
+
+def maintain(conn, reference, eligibility_key):
+    """
+    Hourly housekeeping: retention, expired announcements and reference data changes.
+    Returns (reference, eligibility_key, announced), announced being the unexpired announced auction ids.
+    """
+    with report.stage("retention"):
+        sniper.apply_retention(conn)
+        sniper.prune_announced_auctions(conn)
+        conn.commit()
+    with report.stage("reference_data"):
+        reference, eligibility_key = reload_reference_data(reference, eligibility_key)
+    return reference, eligibility_key, sniper.load_announced_auctions(conn)
+
+
+async def evaluate_snapshots(queue, conn):
+    """
+    Evaluate every queued snapshot as soon as it arrives with the warm reference data, baselines
+    and announced auctions, and run the housekeeping every MAINTENANCE_INTERVAL in between.
+    Runs until None is queued; all database work happens here, one step at a time.
+    """
+    reference, eligibility_key, announced = await asyncio.to_thread(maintain, conn, None, None)
+    next_maintenance = time.time() + MAINTENANCE_INTERVAL
+    while True:
+        try:
+            entry = await asyncio.wait_for(queue.get(), max(0.0, next_maintenance - time.time()))
+        except asyncio.TimeoutError:
+            reference, eligibility_key, announced = await asyncio.to_thread(maintain, conn, reference, eligibility_key)
+            sniper.report_cache_stats()
+            report.write("sniperDaemon")
+            next_maintenance = time.time() + MAINTENANCE_INTERVAL
+            continue
+        if entry is None:
+            break
+        key, published = entry
+        try:
+            if key == COMMODITIES_KEY:
+                await asyncio.to_thread(sniper.process_commodities, conn)
+            else:
+                await asyncio.to_thread(sniper.evaluate_files, conn, [find_auction_file(SAVE_FOLDER, key)], *reference, announced)
+        except Exception as e:
+            print(f"Error evaluating {key}: {e}")
+            continue
+        report.count("snapshots_evaluated")
+        if published is not None:
+            print(f"Evaluated {key} {time.time() - published:.1f}s after its snapshot was published.")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Keep polling the relevant realms and evaluate every new snapshot as soon as it is published.")
+    parser.add_argument("--commodities", action="store_true", help="Also poll the region commodities.")
+    parser.add_argument("--format", choices=("json", "columnar"), default=SNAPSHOT_FORMAT,
+                        help="Storage format of the saved auction snapshots.")
+    parser.add_argument("--delta", choices=("emit", "only"), help="See auctionDataRequest.py --delta.")
+    parser.add_argument("--run-for", type=float, metavar="SECONDS", help="Stop after this many seconds, e.g. for tests.")
+    return parser.parse_args()
+
+
+async def run(args):
+    client_id = os.environ.get("BLIZZARD_CLIENT_ID")
+    client_secret = os.environ.get("BLIZZARD_CLIENT_SECRET")
+    if not client_id or not client_secret:
+        raise Exception("Missing BLIZZARD_CLIENT_ID or BLIZZARD_CLIENT_SECRET environment variables.")
+
+    keys = list(sniper.load_relevant_realms())
+    if args.commodities:
+        keys.append(COMMODITIES_KEY)
+    if not keys:
+        print("No relevant realms configured.")
+        return
+    cadences = load_cadences(keys)
+    conn = await asyncio.to_thread(connect_db)
+    queue = asyncio.Queue()
+    async with create_session() as session:
+        evaluator = asyncio.create_task(evaluate_snapshots(queue, conn))
+        pollers = [
+            asyncio.create_task(poll_snapshots(session, (client_id, client_secret), key, cadence, cadences, queue, args))
+            for key, cadence in cadences.items()
+        ]
+        print(f"Polling {len(keys)} snapshots.")
+        try:
+            await asyncio.wait([evaluator, *pollers], timeout=args.run_for, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            for poller in pollers:
+                poller.cancel()
+            await asyncio.gather(*pollers, return_exceptions=True)
+            # Let the evaluation finish what was already downloaded before the connection closes.
+            if not evaluator.done():
+                await queue.put(None)
+                await evaluator
+            conn.close()
+
+
+def main():
+    args = parse_args()
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("Stopped.")
+    finally:
+        sniper.report_cache_stats()
+        report.write("sniperDaemon")
+
+
+if __name__ == "__main__":
+    main()
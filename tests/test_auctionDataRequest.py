@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+import asyncio
+import pytest
+from aiohttp.test_utils import TestServer
+import auctionDataRequest
+import blizzardClient
+import sniper
+from fakeBlizzardApi import create_app
+from auctionDataRequest import COMMODITIES_KEY, evaluate_snapshots, select_auction_realms, update_realm_details
+
+# Connected realm id -> member realm ids, like the connected realm details endpoint lists them.
+CONNECTED_REALMS = {"1080": ["1080", "531"], "1084": ["1084"], "1302": ["1302", "1096", "1097"]}
+
+
+@pytest.fixture
+def realm_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(auctionDataRequest, "REALMS_PATH", str(tmp_path / "connected-realms.json"))
+    monkeypatch.setattr(auctionDataRequest, "REALM_MAP_PATH", str(tmp_path / "realm-map.json"))
+    return tmp_path
+
+
+def serve_details(monkeypatch, fail=False):
+    async def get_connected_realm_details(session, realm_id, headers):
+        if fail:
+            raise ConnectionError("unavailable")
+        return {"id": int(realm_id), "realms": [{"id": int(member), "name": f"Realm {member}"}
+                                                for member in CONNECTED_REALMS[realm_id]]}
+    monkeypatch.setattr(auctionDataRequest, "get_connected_realm_details", get_connected_realm_details)
+
+
+def test_missing_realm_map_is_built_before_filtering(realm_files, monkeypatch):
+    serve_details(monkeypatch)
+    realm_ids = list(CONNECTED_REALMS)
+    realm_map = asyncio.run(update_realm_details(None, {}, realm_ids))
+
+    # Member realms that are not connected realm ids themselves still select their connected realm.
+    assert select_auction_realms(realm_ids, {"531": "Onyxia", "1097": "Malorne"}, realm_map) == ["1080", "1302"]
+    with open(realm_files / "realm-map.json") as f:
+        assert json.load(f)["realms"]["1096"] == "1302"
+
+
+def test_unbuildable_realm_map_fetches_all_realms(realm_files, monkeypatch, capsys):
+    serve_details(monkeypatch, fail=True)
+    realm_ids = list(CONNECTED_REALMS)
+    realm_map = asyncio.run(update_realm_details(None, {}, realm_ids))
+
+    assert realm_map == {}
+    assert select_auction_realms(realm_ids, {"531": "Onyxia"}, realm_map) == realm_ids
+    assert "Warning" in capsys.readouterr().out
+
+
+def test_pipeline_announces_the_cheapest_items_across_realms(tmp_path, monkeypatch):
+    # Realm 1080 has the three cheapest deals, 1084 the next three; sniper.py would announce five of them.
+    buyouts = {"1080": [100, 200, 300], "1084": [400, 500, 600]}
+    evaluated = []
+
+    def evaluate_files(conn, files, *reference, announce=True):
+        assert not announce
+        realm_id = files[0]
+        evaluated.append(realm_id)
+        return [{"auction_id": f"{realm_id}-{buyout}", "buyout": buyout} for buyout in buyouts[realm_id]]
+
+    notified = []
+    monkeypatch.setattr(sniper, "DB_FILE", str(tmp_path / "auctions.db"))
+    monkeypatch.setattr(sniper, "BASELINE_QUANTILE", None)
+    monkeypatch.setattr(sniper, "load_reference_data", lambda: ({}, {}, {}, 0, None))
+    monkeypatch.setattr(sniper, "evaluate_files", evaluate_files)
+    monkeypatch.setattr(sniper, "process_commodities", lambda conn: evaluated.append(COMMODITIES_KEY))
+    monkeypatch.setattr(sniper, "notify_discord", lambda items, realms: notified.extend(items))
+    monkeypatch.setattr(auctionDataRequest, "find_auction_file", lambda directory, realm_id: realm_id)
+
+    async def run():
+        queue = asyncio.Queue()
+        for key in ("1080", COMMODITIES_KEY, "1084", None):
+            await queue.put(key)
+        await evaluate_snapshots(queue)
+    asyncio.run(run())
+
+    assert evaluated == ["1080", COMMODITIES_KEY, "1084"]
+    assert [item["buyout"] for item in notified] == [100, 200, 300, 400, 500]
+
+
+def test_unchanged_snapshot_is_skipped(realm_files, monkeypatch):
+    served = realm_files / "served"
+    served.mkdir()
+    with open(served / "1080.json", "w") as f:
+        json.dump({"auctions": [{"id": 1, "item": {"id": 19019}, "buyout": 1000, "quantity": 1, "time_left": "LONG"}]}, f)
+    saved = realm_files / "auctions"
+    last_modified_path = realm_files / "last-modified.json"
+    monkeypatch.setattr(auctionDataRequest, "SAVE_FOLDER", f"{saved}{os.sep}")
+    monkeypatch.setattr(auctionDataRequest, "LAST_MODIFIED_PATH", str(last_modified_path))
+    monkeypatch.setattr(blizzardClient, "TOKEN_CACHE_FILE", str(realm_files / "token.json"))
+    monkeypatch.setenv("BLIZZARD_CLIENT_ID", "client")
+    monkeypatch.setenv("BLIZZARD_CLIENT_SECRET", "secret")
+    monkeypatch.setattr(sys, "argv", ["auctionDataRequest.py", "--all-realms"])
+    statuses = []
+
+    async def run_twice():
+        # The fake API publishes one snapshot an hour, so the second run asks for the same one.
+        server = TestServer(create_app(str(served), 3600))
+        await server.start_server()
+        try:
+            monkeypatch.setattr(auctionDataRequest, "BASE_URL", str(server.make_url("")).rstrip("/"))
+            monkeypatch.setattr(blizzardClient, "OAUTH_TOKEN_URL", str(server.make_url("/oauth/token")))
+            await auctionDataRequest.main()
+            statuses.append((os.stat(saved / "1080.json").st_mtime_ns, last_modified_path.read_text()))
+            await auctionDataRequest.main()
+            statuses.append((os.stat(saved / "1080.json").st_mtime_ns, last_modified_path.read_text()))
+        finally:
+            await server.close()
+
+    counts = {}
+    monkeypatch.setattr(auctionDataRequest.report, "count", lambda name, value=1: counts.__setitem__(name, counts.get(name, 0) + value))
+    asyncio.run(run_twice())
+
+    assert "1080" in json.loads(statuses[0][1])
+    # The 304 left the saved snapshot and its Last-Modified value as they were.
+    assert statuses[1] == statuses[0]
+    assert counts["snapshots_saved"] == 1
+    assert counts["snapshots_not_modified"] == 1
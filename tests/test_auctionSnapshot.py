@@ -0,0 +1,132 @@
+import os
+import json
+import auctionSnapshot
+from auctionSnapshot import (
+    _iter_file_rows, apply_delta, iter_auction_rows, iter_auctions, list_deltas,
+    normalise_auctions_file, read_delta, read_header, rebuild_snapshot, save_snapshot, write_columnar_snapshot,
+)
+from jsonBackend import auction_row
+
+
+def make_auctions(count):
+    return [
+        {
+            "id": 1000 + n,
+            "item": {"id": 19019 + n % 500, "context": 3, "bonus_lists": [6652, 1500 + n % 7]} if n % 3 else {"id": 19019},
+            "buyout": 10000 * (n + 1),
+            "quantity": 1,
+            "time_left": "LONG",
+        }
+        for n in range(count)
+    ]
+
+
+def write_compact(path, auctions):
+    """Write auctions the way the API returns them: compact JSON on a single line."""
+    body = {"_links": {"self": {"href": "https://example/auctions"}}, "connected_realm": {"href": "https://example/1080"}, "auctions": auctions}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(body, f, separators=(",", ":"))
+
+
+def count_line_decodes(monkeypatch):
+    """Count the auctions decoded by the line-based fast path."""
+    calls = []
+    line_value = auctionSnapshot._JsonStream.line_value
+
+    def counting(self, fast):
+        calls.append(fast)
+        return line_value(self, fast)
+    monkeypatch.setattr(auctionSnapshot._JsonStream, "line_value", counting)
+    return calls
+
+
+def test_fast_path_only_reads_normalised_files(tmp_path, monkeypatch):
+    auctions = make_auctions(2000)
+    compact = str(tmp_path / "compact.json")
+    write_compact(compact, auctions)
+    indented = str(tmp_path / "indented.json")
+    with open(indented, "w", encoding="utf-8") as f:
+        json.dump({"connected_realm": {"href": "https://example/1080"}, "auctions": auctions}, f, indent=2)
+    normalised = str(tmp_path / "1080.json")
+    normalise_auctions_file(compact, normalised)
+
+    calls = count_line_decodes(monkeypatch)
+    # Raw API bodies never go through the line search, however they are laid out.
+    for path in (compact, indented):
+        assert list(iter_auctions(path)) == auctions
+        assert list(_iter_file_rows(path)) == [auction_row(auction) for auction in auctions]
+    assert calls == []
+    # Files from write_auctions_file are decoded line by line.
+    assert list(iter_auctions(normalised)) == auctions
+    assert len(calls) == len(auctions)
+
+
+def test_normalised_file_round_trips(tmp_path):
+    auctions = make_auctions(500)
+    source = str(tmp_path / "raw.json")
+    write_compact(source, auctions)
+    path = str(tmp_path / "1080.json")
+    assert normalise_auctions_file(source, path, {"snapshot_id": "a"}) == len(auctions)
+    with open(path, "r", encoding="utf-8") as f:
+        assert sum(1 for _ in f) > len(auctions)
+    assert list(iter_auctions(path)) == auctions
+    assert list(_iter_file_rows(path)) == [auction_row(auction) for auction in auctions]
+    header = read_header(path)
+    assert header["snapshot_id"] == "a"
+    assert auctionSnapshot.AUCTION_LINES_KEY not in header
+
+
+def snapshots(tmp_path, count):
+    """Raw API bodies of count successive snapshots: auctions are sold, repriced and listed. Returns (path, rows) pairs."""
+    auctions = make_auctions(200)
+    result = []
+    for n in range(count):
+        listed = [dict(auction, id=auction["id"] + 1000 * (n + 1)) for auction in make_auctions(10)]
+        auctions = [dict(auction, buyout=auction["buyout"] + 1) if auction["id"] % 5 == 0 else auction
+                    for auction in auctions[10:]] + listed
+        path = str(tmp_path / f"raw{n}.json")
+        write_compact(path, auctions)
+        result.append((path, [auction_row(auction) for auction in auctions]))
+    return result
+
+
+def test_delta_round_trip(tmp_path, monkeypatch):
+    raws = snapshots(tmp_path, 3)
+    for suffix in (".json", auctionSnapshot.SNAPSHOT_SUFFIX):
+        directory = tmp_path / suffix.strip(".")
+        directory.mkdir()
+        path = str(directory / f"1080{suffix}")
+
+        # emit: every snapshot is stored in full, with a delta from the previous one.
+        for raw, rows in raws:
+            assert save_snapshot(raw, path, "emit") == len(rows)
+        emitted = list_deltas(str(directory), "1080")
+        assert len(emitted) == 2
+        first = {row[0]: row[1:] for row in raws[0][1]}
+        for delta_path in emitted:
+            apply_delta(first, read_delta(delta_path))
+        assert first == {row[0]: row[1:] for row in raws[-1][1]}
+        # Readers stream the full file instead of rebuilding it from the emitted deltas.
+        with monkeypatch.context() as m:
+            m.setattr(auctionSnapshot, "load_snapshot", None)
+            assert list(iter_auction_rows(path)) == raws[-1][1]
+
+        # only: the full snapshot stays, the new snapshots are chained onto it as deltas.
+        for raw, rows in raws:
+            save_snapshot(raw, path, "only")
+        chain = [delta_path for delta_path in list_deltas(str(directory), "1080") if delta_path not in emitted]
+        assert len(chain) == 3
+        assert sorted(iter_auction_rows(path)) == sorted(raws[-1][1])
+
+        # rebuild: the base file plus the chain gives the latest snapshot.
+        rebuilt = rebuild_snapshot(path, chain)
+        assert sorted((auction_id,) + row for auction_id, row in rebuilt.items()) == sorted(raws[-1][1])
+        assert os.path.exists(path)
+
+
+def test_columnar_snapshot_skips_malformed_auctions(tmp_path):
+    auctions = make_auctions(20)
+    malformed = [{"item": {"id": 19019}, "buyout": 1}, {"id": 5, "item": {}, "buyout": 1}, {"id": 6, "buyout": 1}]
+    path = str(tmp_path / f"1080{auctionSnapshot.SNAPSHOT_SUFFIX}")
+    assert write_columnar_snapshot(path, {}, auctions[:10] + malformed + auctions[10:]) == len(auctions)
+    assert list(iter_auction_rows(path)) == [auction_row(auction) for auction in auctions]
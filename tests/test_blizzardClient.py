@@ -0,0 +1,113 @@
+import time
+import asyncio
+import blizzardClient
+from blizzardClient import REQUESTS_PER_SECOND, THROTTLE_COOLDOWN, TokenBucket, request
+
+# Requests per second Blizzard allows a client.
+API_LIMIT = 100
+
+
+def test_large_quota_does_not_throttle():
+    bucket = TokenBucket(90)
+    # An hourly quota with plenty left, reset as seconds or as an epoch timestamp.
+    bucket.update({"X-RateLimit-Remaining": "35000", "X-RateLimit-Reset": "3000"})
+    assert bucket.rate == 90
+    bucket.update({"X-RateLimit-Remaining": "35000", "X-RateLimit-Reset": str(int(time.time()) + 3000)})
+    assert bucket.rate == 90
+
+
+def test_nearly_spent_quota_lasts_until_reset():
+    bucket = TokenBucket(90)
+    bucket.update({"X-RateLimit-Remaining": "40", "X-RateLimit-Reset": "2"})
+    assert bucket.rate == 20
+    bucket.update({"X-RateLimit-Remaining": "40", "X-RateLimit-Reset": str(int(time.time()) + 4)})
+    assert 9 <= bucket.rate <= 14
+    bucket.update({"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "30"})
+    assert bucket.rate == 1
+
+
+def test_backoff_outlasts_successes():
+    bucket = TokenBucket(90)
+    now = 1000.0
+    bucket.throttle(1.0, now)
+    assert bucket.rate == 45
+    for n in range(100):
+        bucket.update({}, now + 1 + n * 0.01)
+        bucket.update({"X-RateLimit-Remaining": "80", "X-RateLimit-Reset": "1"}, now + 1 + n * 0.01)
+    assert bucket.rate == 45
+    later = now + 1 + THROTTLE_COOLDOWN
+    for n in range(45):
+        bucket.update({}, later + n * 0.01)
+    assert bucket.rate == 90
+
+
+class VirtualClock:
+    """Stands in for time and asyncio in blizzardClient: time stands still and sleeps are recorded."""
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.slept = seconds
+
+
+def acquisition_times(bucket, clock, bursts):
+    """When each caller of bursts (pairs of caller count and idle seconds before them, all arriving at once) gets through."""
+    done = []
+
+    async def run():
+        for count, idle in bursts:
+            clock.now += idle
+            for _ in range(count):
+                clock.slept = 0.0
+                await bucket.acquire()
+                done.append(clock.now + clock.slept)
+    asyncio.run(run())
+    return sorted(done)
+
+
+def test_no_second_exceeds_the_api_limit(monkeypatch):
+    clock = VirtualClock()
+    monkeypatch.setattr(blizzardClient, "time", clock)
+    monkeypatch.setattr(blizzardClient, "asyncio", clock)
+    # 300 concurrent callers, then another 300 once the bucket had time to refill.
+    done = acquisition_times(TokenBucket(REQUESTS_PER_SECOND), clock, [(300, 0), (300, 10)])
+
+    end = 0
+    for start, started_at in enumerate(done):
+        while end < len(done) and done[end] < started_at + 1:
+            end += 1
+        assert end - start <= API_LIMIT
+
+
+class FakeResponse:
+    def __init__(self, status, headers):
+        self.status = status
+        self.headers = headers
+
+    def release(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+
+    async def get(self, url, headers=None):
+        return FakeResponse(self.statuses.pop(0), {"Retry-After": "0", "X-RateLimit-Remaining": "1", "X-RateLimit-Reset": "1"})
+
+
+def test_last_429_still_throttles(monkeypatch):
+    bucket = TokenBucket(REQUESTS_PER_SECOND)
+    monkeypatch.setattr(blizzardClient, "rate_limiter", bucket)
+
+    async def fetch(statuses, retries):
+        async with request(FakeSession(statuses), "https://example/data/wow/item/1", retries=retries) as resp:
+            return resp.status
+    assert asyncio.run(fetch([429, 429], 2)) == 429
+    # Both 429s halved the rate, and the rate-limit headers of a 429 are ignored.
+    assert bucket.rate == REQUESTS_PER_SECOND / 4
+    assert bucket.cooldown_until > time.monotonic()
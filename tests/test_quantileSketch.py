@@ -0,0 +1,55 @@
+import random
+import pytest
+from quantileSketch import SKETCH_K, KLLSketch, merge_sketches
+
+COUNT = 100_000
+# The rank error documented in quantileSketch.py.
+RANK_ERROR = 1.7 / SKETCH_K
+QUANTILES = [q / 100 for q in range(1, 100)]
+
+
+@pytest.fixture
+def prices():
+    # Distinct values, so a value's rank is the value itself.
+    values = list(range(COUNT))
+    random.Random(7).shuffle(values)
+    return values
+
+
+def sketch_of(values):
+    sketch = KLLSketch()
+    for value in values:
+        sketch.update(value)
+    return sketch
+
+
+def test_rank_error_is_bounded(prices):
+    sketch = sketch_of(prices)
+    assert sketch.n == COUNT
+    for q in QUANTILES:
+        assert abs(sketch.quantile(q) / COUNT - q) <= RANK_ERROR
+    assert KLLSketch().quantile(0.5) is None
+
+
+def test_merged_sketches_match_one_sketch_of_both_streams(prices):
+    split = COUNT * 3 // 5
+    merged = merge_sketches([sketch_of(prices[:split]), sketch_of(prices[split:])])
+    single = sketch_of(prices)
+    assert merged.n == single.n
+    for q in QUANTILES:
+        assert abs(merged.quantile(q) / COUNT - q) <= RANK_ERROR
+        # Both are within the bound of the true rank, so within twice of each other.
+        assert abs(merged.quantile(q) - single.quantile(q)) / COUNT <= 2 * RANK_ERROR
+
+
+def test_serialisation_round_trips(prices):
+    sketch = sketch_of(prices[:COUNT // 2])
+    restored = KLLSketch.from_bytes(sketch.to_bytes())
+    assert (restored.k, restored.n, restored.parity) == (sketch.k, sketch.n, sketch.parity)
+    assert [sorted(level) for level in restored.levels] == [sorted(level) for level in sketch.levels]
+
+    # A restored sketch keeps compacting exactly like the original.
+    for value in prices[COUNT // 2:]:
+        sketch.update(value)
+        restored.update(value)
+    assert [restored.quantile(q) for q in QUANTILES] == [sketch.quantile(q) for q in QUANTILES]
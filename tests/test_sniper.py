@@ -0,0 +1,217 @@
+import json
+import random
+import datetime
+from functools import partial
+import pytest
+import referenceCache
+import sniper
+from sniper import ALL_REALMS, MIN_BUYOUT, AuctionRecord, Eligibility
+
+
+@pytest.fixture
+def bonus_table(tmp_path, monkeypatch):
+    """A small bonus table of three pricing bonus ids, read through the usual reference cache."""
+    bonus_file = str(tmp_path / "bonusTableSniperTest.json")
+    with open(bonus_file, "w") as f:
+        json.dump({
+            "10": {"tag": "Heroic", "category": "ilvl", "level": 7},
+            "11": {"tag": "Mythic", "category": "ilvl", "level": 13},
+            "12": {"tag": "Socket", "category": "socket"},
+        }, f)
+    monkeypatch.setattr(sniper, "RAIDERIO_BONUS_FILE", bonus_file)
+    monkeypatch.setattr(referenceCache, "REFERENCE_CACHE_DIR", str(tmp_path / "cache"))
+    return sniper.load_bonus_table()
+
+
+def make_records(rng, count):
+    bonus_lists = [(), (10,), (11,), (10, 12), (99,)]
+    return [
+        AuctionRecord(rng.choice(("1080", "1331", "1605")), 1000 + n, rng.randint(1, 60), rng.randint(1, 400) * 10 ** 7,
+                      1, "LONG", rng.choice(bonus_lists), "2026-01-01T00:00:00+00:00")
+        for n in range(count)
+    ]
+
+
+def test_numpy_engine_matches_python_engine(bonus_table, monkeypatch):
+    numpy_engine = pytest.importorskip("numpyEngine")
+    rng = random.Random(7)
+    records = make_records(rng, 5000)
+    # Items 1-40 are compiled, a few of them ineligible or with overrides; 41-60 go through the presets.
+    # Ratios and prices are exact in floating point, so some buyouts sit right at their threshold.
+    eligibility = Eligibility({item_id: (MIN_BUYOUT, 0.25) for item_id in range(1, 41)})
+    eligibility.update({5: None, 6: None, 7: (5 * MIN_BUYOUT, 0.5), 8: (0, 0.125)})
+    averages = {
+        (item_id, bonus_key): rng.randint(1, 400) * 10 ** 8
+        for item_id in range(1, 61) for bonus_key in ("", "Heroic", "Mythic", "Heroic-Socket")
+        if rng.random() < 0.9
+    }
+    special_items = {str(records[n].auction_id): records[n].buyout + 1 for n in range(0, 5000, 97)}
+    monkeypatch.setattr(sniper, "load_item_data", lambda item_id: {"name": f"Item {item_id}", "level": 600})
+    process_func = partial(sniper.process_record, averages=averages, special_items=special_items, expansion_data={},
+                           expansion_presets={}, latest_expansion=None, eligibility=eligibility)
+
+    expected = sniper.find_candidates(records, process_func)
+    found = sniper.find_candidates_numpy(numpy_engine, records, averages, special_items, eligibility, process_func)
+    assert len(expected) > 50
+    assert list(found.items()) == list(expected.items())
+
+
+def test_retention_preserves_min_avg_count(tmp_path, monkeypatch):
+    monkeypatch.setattr(sniper, "BASELINE_QUANTILE", None)
+    conn = sniper.connect_db(str(tmp_path / "auctions.db"))
+    sniper.init_db(conn)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    ages = {
+        "raw": [now - datetime.timedelta(hours=n) for n in range(1, 4)],
+        # Two runs in the same hour, past RAW_RETENTION_DAYS.
+        "hourly": [(now - datetime.timedelta(days=sniper.RAW_RETENTION_DAYS + 2)).replace(minute=minute) for minute in (10, 30)],
+        # Two runs on the same day, past HOURLY_RETENTION_DAYS.
+        "daily": [(now - datetime.timedelta(days=sniper.HOURLY_RETENTION_DAYS + 5)).replace(hour=hour) for hour in (3, 15)],
+    }
+    prices = {}
+    for n, timestamp in enumerate(sorted(sum(ages.values(), []))):
+        batch = {("1080", 19019, ""): 1000 + 100 * n, ("1331", 19019, ""): 5000 + n, ("1080", 2589, "Heroic"): 70 * (n + 1)}
+        sniper.insert_prices(conn, batch, timestamp.isoformat())
+        prices[timestamp] = batch
+    averages = sniper.get_historical_averages(conn)
+    stats = sniper.get_price_stats(conn, realm="1080")
+
+    sniper.apply_retention(conn)
+
+    assert conn.execute("SELECT COUNT(*) FROM item_prices;").fetchone()[0] == 3 * len(ages["raw"])
+    for table, bucket in (("item_prices_hourly", ages["hourly"][0].isoformat()[:13]),
+                          ("item_prices_daily", ages["daily"][0].isoformat()[:10])):
+        rows = conn.execute(f"SELECT realm, item_id, bonus_key, bucket, min_buyout, avg_buyout, count FROM {table};").fetchall()
+        expected = []
+        for realm, item_id, bonus_key in prices[ages["raw"][0]]:
+            observed = [batch[(realm, item_id, bonus_key)] for timestamp, batch in prices.items()
+                        if timestamp in ages[table.split("_")[-1]]]
+            expected.append((realm, item_id, bonus_key, bucket, min(observed), sum(observed) / len(observed), len(observed)))
+        assert sorted(rows) == sorted(expected)
+        assert all(isinstance(row[-1], int) for row in rows)
+    assert sniper.get_historical_averages(conn) == averages
+    assert sniper.get_price_stats(conn, realm="1080") == stats
+    assert averages[(19019, "")] == pytest.approx(
+        sum(batch[(realm, 19019, "")] for batch in prices.values() for realm in ("1080", "1331")) / (2 * len(prices)))
+    assert conn.execute("SELECT count FROM item_price_stats WHERE item_id = 19019 AND realm = ?;", (ALL_REALMS,)).fetchone()[0] == 2 * len(prices)
+    conn.close()
+
+
+def test_sketches_survive_a_run_without_quantile(tmp_path, monkeypatch):
+    monkeypatch.setattr(sniper, "BASELINE_QUANTILE", 0.5)
+    conn = sniper.connect_db(str(tmp_path / "auctions.db"))
+    sniper.init_db(conn)
+    sniper.insert_prices(conn, {("1080", 19019, ""): 1000}, datetime.datetime.now(datetime.timezone.utc).isoformat())
+
+    monkeypatch.setattr(sniper, "BASELINE_QUANTILE", None)
+    sniper.init_db(conn)
+    sniper.insert_prices(conn, {("1080", 19019, ""): 3000}, datetime.datetime.now(datetime.timezone.utc).isoformat())
+
+    # Sketches are kept, but only updated while BASELINE_QUANTILE is set.
+    assert sniper.get_price_quantiles(conn, 0.5) == {(19019, ""): 1000}
+    conn.close()
+
+
+def test_price_stats_match_the_raw_history(tmp_path, monkeypatch):
+    monkeypatch.setattr(sniper, "BASELINE_QUANTILE", None)
+    conn = sniper.connect_db(str(tmp_path / "auctions.db"))
+    sniper.init_db(conn)
+    rng = random.Random(3)
+    start = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=5)
+    for run in range(6):
+        # Not every variant is seen on every realm and run.
+        batch = {(realm, item_id, bonus_key): rng.randint(1, 10 ** 9)
+                 for realm in ("1080", "1331", "1624") for item_id in (19019, 2589, 6948) for bonus_key in ("", "Heroic")
+                 if rng.random() < 0.7}
+        sniper.insert_prices(conn, batch, (start + datetime.timedelta(minutes=20 * run)).isoformat())
+
+    def raw_stats(realm=None):
+        where = "WHERE realm = ?" if realm else ""
+        rows = conn.execute(f"SELECT item_id, bonus_key, COUNT(*), AVG(min_buyout) FROM item_prices {where} "
+                            "GROUP BY item_id, bonus_key;", (realm,) if realm else ()).fetchall()
+        return {(item_id, bonus_key): (count, mean) for item_id, bonus_key, count, mean in rows}
+
+    def stats(realm=ALL_REALMS):
+        return {key: (count, mean) for key, (count, mean, stddev, ewma) in sniper.get_price_stats(conn, realm=realm).items()}
+
+    def assert_matches_raw():
+        for realm in (None, "1080", "1331", "1624"):
+            expected = raw_stats(realm)
+            actual = stats(realm or ALL_REALMS)
+            assert actual.keys() == expected.keys()
+            for key, (count, mean) in expected.items():
+                assert actual[key][0] == count
+                assert actual[key][1] == pytest.approx(mean)
+        averages = sniper.get_historical_averages(conn, [(19019, ""), (6948, "Heroic")])
+        assert averages == pytest.approx({key: mean for key, (count, mean) in raw_stats().items()
+                                          if key in ((19019, ""), (6948, "Heroic"))})
+
+    assert_matches_raw()
+    # A database from before item_price_stats existed is backfilled from its history once.
+    conn.execute("DROP TABLE item_price_stats;")
+    sniper.init_db(conn)
+    assert_matches_raw()
+    conn.close()
+
+
+def test_announced_auctions_migrate_and_expire(tmp_path):
+    conn = sniper.connect_db(str(tmp_path / "auctions.db"))
+    # The table as it was before announcements were timestamped.
+    conn.execute("CREATE TABLE announced_auctions (auction_id TEXT PRIMARY KEY);")
+    conn.executemany("INSERT INTO announced_auctions (auction_id) VALUES (?);", [("1",), ("2",), ("3",)])
+    conn.commit()
+
+    sniper.init_announced_db(conn)
+    # Migrated announcements are kept for one TTL from now.
+    assert sniper.load_announced_auctions(conn) == {"1", "2", "3"}
+
+    expired = (datetime.datetime.now(datetime.timezone.utc)
+               - datetime.timedelta(hours=sniper.ANNOUNCED_TTL_HOURS + 1)).isoformat()
+    conn.execute("UPDATE announced_auctions SET announced_at = ? WHERE auction_id IN ('1', '3');", (expired,))
+    sniper.save_announced_auctions(conn, [{"auction_id": 4}, {"auction_id": 2}])
+    # Expired announcements are ignored before they are pruned...
+    assert sniper.load_announced_auctions(conn) == {"2", "4"}
+    sniper.init_announced_db(conn)
+    # ...and deleted by the next run.
+    assert {row[0] for row in conn.execute("SELECT auction_id FROM announced_auctions;")} == {"2", "4"}
+
+    # Only the looked up candidates come back.
+    assert sniper.load_announced_auctions(conn, [1, 2, 5]) == {"2"}
+    assert sniper.load_announced_auctions(conn, iter([4, 3])) == {"4"}
+    assert sniper.load_announced_auctions(conn, []) == set()
+    conn.close()
+
+
+def test_eligibility_is_recompiled_when_an_input_changes(tmp_path, monkeypatch):
+    inputs = {name: tmp_path / f"{name}.input" for name in ("ITEM_CLASSES_FILE", "EXPANSION_FILE", "CATALOG_FILE")}
+    for name, path in inputs.items():
+        path.write_text("initial")
+        monkeypatch.setattr(sniper, name, str(path))
+    monkeypatch.setattr(sniper, "ELIGIBILITY_CACHE_FILE", str(tmp_path / "cache" / "eligibility.json"))
+    compiled = []
+
+    def compile_eligibility(expansion_data, presets, latest_expansion):
+        compiled.append(1)
+        return Eligibility({19019: (sniper.MIN_BUYOUT, sniper.THRESHOLD_RATIO), 2589: None}, {2589: "quality"})
+    monkeypatch.setattr(sniper, "compile_eligibility", compile_eligibility)
+
+    def load():
+        eligibility = sniper.load_eligibility({}, {}, 0)
+        assert eligibility == {19019: (sniper.MIN_BUYOUT, sniper.THRESHOLD_RATIO), 2589: None}
+        return len(compiled)
+
+    assert load() == 1
+    assert load() == 1
+    expected = 1
+    for path in inputs.values():
+        path.write_text(f"changed {path.name}")
+        expected += 1
+        assert load() == expected
+        assert load() == expected
+    monkeypatch.setattr(sniper, "MIN_BUYOUT", sniper.MIN_BUYOUT * 2)
+    assert load() == expected + 1
+    monkeypatch.setattr(sniper, "THRESHOLD_RATIO", sniper.THRESHOLD_RATIO / 2)
+    assert load() == expected + 2
+    inputs["CATALOG_FILE"].unlink()
+    assert load() == expected + 3
+    assert load() == expected + 3
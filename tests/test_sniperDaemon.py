@@ -0,0 +1,66 @@
+import os
+import json
+from email.utils import formatdate
+import referenceCache
+import sniper
+from sniperDaemon import MAX_REFRESH_INTERVAL, POLL_INTERVAL, RealmCadence, reload_reference_data
+
+HOUR = 3600
+
+
+def observe_at(cadence, published):
+    cadence.observe(formatdate(published, usegmt=True))
+
+
+def test_stale_last_modified_is_not_a_gap():
+    # The workflow's last snapshot was at 21:00, the daemon starts at 09:00 the next day.
+    now = 1_000_000_000
+    cadence = RealmCadence()
+    cadence.observe(formatdate(now - 12 * HOUR, usegmt=True), now)
+    assert cadence.published == []
+    assert cadence.last_modified is not None
+    observe_at(cadence, now)
+    assert cadence.interval() is None
+    cadence.schedule(now)
+    assert cadence.next_poll == now + POLL_INTERVAL
+
+
+def test_missed_snapshots_do_not_stretch_the_cadence():
+    start = 1_000_000_000
+    cadence = RealmCadence()
+    for published in (start, start + 11 * HOUR, start + 12 * HOUR, start + 15 * HOUR, start + 16 * HOUR):
+        observe_at(cadence, published)
+    assert cadence.interval() == HOUR
+    cadence.schedule(start + 16 * HOUR + 60)
+    assert cadence.next_poll == start + 17 * HOUR
+
+
+def test_interval_is_capped():
+    start = 1_000_000_000
+    cadence = RealmCadence()
+    observe_at(cadence, start)
+    observe_at(cadence, start + 11 * HOUR)
+    assert cadence.interval() == MAX_REFRESH_INTERVAL
+
+
+def test_reload_picks_up_a_changed_bonus_table(tmp_path, monkeypatch):
+    bonus_file = str(tmp_path / "bonusTableTest.json")
+    monkeypatch.setattr(sniper, "RAIDERIO_BONUS_FILE", bonus_file)
+    monkeypatch.setattr(referenceCache, "REFERENCE_CACHE_DIR", str(tmp_path / "cache"))
+
+    def write_bonuses(tag, level, mtime):
+        with open(bonus_file, "w") as f:
+            json.dump({"10": {"tag": tag, "category": "ilvl", "level": level}}, f)
+        os.utime(bonus_file, (mtime, mtime))
+
+    write_bonuses("Heroic", 7, 1_000_000_000)
+    reference, key = "reference", sniper.get_eligibility_key()
+    sniper.load_bonus_table()
+    assert sniper.get_bonus_key([10]) == "Heroic"
+    assert sniper.calculate_effective_ilvl(600, [10]) == 607
+
+    write_bonuses("Mythic", 13, 1_000_003_600)
+    # The eligibility does not depend on the bonus table, so the rest of the reference data is kept.
+    assert reload_reference_data(reference, key) == (reference, key)
+    assert sniper.get_bonus_key([10]) == "Mythic"
+    assert sniper.calculate_effective_ilvl(600, [10]) == 613